@@ -0,0 +1,271 @@
+import os
+import re
+import struct
+import threading
+import orjson
+from typing import Callable, Iterable, NamedTuple, Optional
+from cachetools import LRUCache
+from google.cloud import storage
+
+# 음성 조각 이어 붙이기
+#
+# "{user_name}, 괜찮아! ..." 나 "정답은 {answer}! ..." 처럼 이름/숫자만 바뀌는 문장을
+# 미리 합성해 둔 조각(고정 문구, 숫자 0~100)과 이름 조각을 MP3 프레임 단위로 이어 붙여
+# 만듭니다. 처음 보는 조각(새 이름 등)만 TTS 를 호출하고, 그 결과도 조각으로 캐시합니다.
+#
+# MP3 는 프레임마다 헤더가 있어 ID3 태그와 Xing/Info 헤더 프레임만 걷어 내면
+# 프레임을 그대로 이어 붙여도 재생됩니다 (같은 음성 설정이라 샘플레이트가 같음).
+#
+# 고정 조각은 scripts/build_audio_fragments.py 로 한 번만 합성해 번들 파일
+# (로컬 경로 또는 gs://)로 저장하고, 서버는 시작할 때 번들을 읽기만 합니다.
+
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "1024"))
+NUMBER_FRAGMENTS = tuple(str(n) for n in range(101))
+
+BUNDLE_MAGIC = b"MAFRAG1"
+
+TEMPLATE_SLOT = re.compile(r"\{(\w+)\}")
+# 조각 앞쪽의 구두점 (슬롯 뒤 쉼표/느낌표는 조각 사이 쉼으로 대신함)
+LEADING_PUNCTUATION = ",.!?~ "
+
+# MPEG Layer III 비트레이트 (kbps) / 샘플레이트 (Hz)
+MPEG1_BITRATES = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+MPEG2_BITRATES = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG1
+    2: (22050, 24000, 16000),  # MPEG2
+    0: (11025, 12000, 8000),   # MPEG2.5
+}
+
+
+class Fragment(NamedTuple):
+    frames: bytes       # 태그를 걷어 낸 MP3 프레임들
+    sample_rate: int
+
+
+def _frame_info(data: bytes, pos: int):
+    """pos 위치 프레임의 (길이, 샘플레이트), 프레임 헤더가 아니면 None"""
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[pos + 1] >> 3) & 0x03
+    layer = (data[pos + 1] >> 1) & 0x03
+    bitrate_index = data[pos + 2] >> 4
+    sample_rate_index = (data[pos + 2] >> 2) & 0x03
+    padding = (data[pos + 2] >> 1) & 0x01
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    if version == 3:
+        length = 144 * MPEG1_BITRATES[bitrate_index] * 1000 // sample_rate + padding
+    else:
+        length = 72 * MPEG2_BITRATES[bitrate_index] * 1000 // sample_rate + padding
+    return length, sample_rate
+
+
+def _is_vbr_header(frame: bytes) -> bool:
+    """Xing/Info (side info 바로 뒤) 또는 VBRI (36바이트 위치) 헤더 프레임인지"""
+    mpeg1 = (frame[1] >> 3) & 0x03 == 3
+    mono = frame[3] >> 6 == 3
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    offset = 4 + side_info + (0 if frame[1] & 0x01 else 2)  # protection bit 0 이면 CRC 2바이트
+    return frame[offset:offset + 4] in (b"Xing", b"Info") or frame[36:40] == b"VBRI"
+
+
+def parse_mp3(data: bytes) -> Fragment:
+    """TTS MP3 -> 이어 붙일 수 있는 프레임 조각 (Layer III 가 아니면 ValueError)"""
+    pos = 0
+    # ID3v2 태그 (크기는 7비트씩 나눈 syncsafe 정수)
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        pos = 10 + size + (10 if data[5] & 0x10 else 0)
+    end = len(data) - 128 if data[-128:-125] == b"TAG" else len(data)
+
+    frames = []
+    sample_rate = None
+    while pos < end:
+        info = _frame_info(data, pos)
+        if info is None:
+            raise ValueError(f"Not an MPEG Layer III frame at byte {pos}")
+        length, rate = info
+        frame = data[pos:min(pos + length, end)]
+        # 첫 프레임의 VBR 헤더는 원래 파일 길이 정보라 이어 붙이면 안 됨
+        if not frames and sample_rate is None and _is_vbr_header(frame):
+            sample_rate = rate
+        else:
+            if sample_rate is not None and rate != sample_rate:
+                raise ValueError("Sample rate changes within fragment")
+            sample_rate = rate
+            frames.append(frame)
+        pos += length
+
+    if not frames:
+        raise ValueError("No audio frames")
+    return Fragment(b"".join(frames), sample_rate)
+
+
+def concat(fragments: Iterable[Fragment]) -> bytes:
+    """프레임 경계에서 조각 이어 붙이기 (샘플레이트가 다르면 ValueError)"""
+    fragments = list(fragments)
+    if len({f.sample_rate for f in fragments}) > 1:
+        raise ValueError("Fragments have different sample rates")
+    return b"".join(f.frames for f in fragments)
+
+
+def _clean(text: str) -> str:
+    return text.strip().lstrip(LEADING_PUNCTUATION).strip()
+
+
+def template_parts(template: str, **values) -> list:
+    """템플릿 -> 조각 문자열 목록 (예: "{name}, 괜찮아!" -> ["민수", "괜찮아!"])"""
+    parts = []
+    for i, piece in enumerate(TEMPLATE_SLOT.split(template)):
+        # split 결과는 고정 문구와 슬롯 이름이 번갈아 나옴
+        text = _clean(str(values[piece]) if i % 2 else piece)
+        if text:
+            parts.append(text)
+    return parts
+
+
+class FragmentLibrary:
+    """조각 캐시 + 조립
+
+    prewarm 한 조각(고정 문구, 숫자)은 계속 보관하고,
+    요청 중에 합성한 조각(이름 등)은 LRU 로 최대 maxsize 개까지 보관합니다.
+    """
+
+    def __init__(self, synthesize: Callable[[str], Optional[bytes]], maxsize: int = FRAGMENT_CACHE_SIZE,
+                 pinned_texts: Iterable[str] = ()):
+        self.synthesize = synthesize
+        # 번들에 들어가는 조각 (처음 합성될 때도 LRU 대신 계속 보관)
+        self.pinned_texts = frozenset(pinned_texts)
+        self.pinned = {}
+        self.recent = LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.stats_counter = {"hits": 0, "synthesized": 0}
+
+    def fragment(self, text: str, pin: bool = False) -> Optional[Fragment]:
+        """조각 하나 (없으면 합성해서 캐시, 실패하면 None)"""
+        with self.lock:
+            fragment = self.pinned.get(text)
+            if fragment is None:
+                fragment = self.recent.get(text)
+                if fragment is not None and pin:
+                    self.pinned[text] = self.recent.pop(text)
+            if fragment is not None:
+                self.stats_counter["hits"] += 1
+                return fragment
+
+        audio = self.synthesize(text)
+        if not audio:
+            return None
+        try:
+            fragment = parse_mp3(audio)
+        except ValueError as e:
+            print(f"⚠️ Fragment parse failed ({text!r}): {e}")
+            return None
+
+        with self.lock:
+            self.stats_counter["synthesized"] += 1
+            if pin or text in self.pinned_texts:
+                self.pinned[text] = fragment
+            else:
+                self.recent[text] = fragment
+        return fragment
+
+    def render(self, template: str, **values) -> Optional[bytes]:
+        """템플릿을 조각으로 조립한 MP3 (조각 하나라도 실패하면 None)"""
+        fragments = []
+        for part in template_parts(template, **values):
+            fragment = self.fragment(part)
+            if fragment is None:
+                return None
+            fragments.append(fragment)
+        try:
+            return concat(fragments)
+        except ValueError as e:
+            print(f"⚠️ Fragment concat failed: {e}")
+            return None
+
+    def prewarm(self, texts: Iterable[str]) -> int:
+        """조각 미리 합성 (보관 고정), 새로 합성한 개수 반환"""
+        before = self.stats_counter["synthesized"]
+        for text in texts:
+            self.fragment(text, pin=True)
+        return self.stats_counter["synthesized"] - before
+
+    def load(self, fragments: dict) -> int:
+        """번들에서 읽은 조각을 보관 고정으로 추가"""
+        with self.lock:
+            self.pinned.update(fragments)
+        return len(fragments)
+
+    def snapshot(self) -> dict:
+        """보관 고정된 조각 (번들 저장용)"""
+        with self.lock:
+            return dict(self.pinned)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.stats_counter, pinned=len(self.pinned), recent=len(self.recent))
+
+
+def template_literals(template: str) -> list:
+    """템플릿의 고정 문구 조각들 (prewarm 용)"""
+    literals = (_clean(text) for text in TEMPLATE_SLOT.split(template)[::2])
+    return [text for text in literals if text]
+
+
+def dump_bundle(fragments: dict, voice: str) -> bytes:
+    """조각 번들: MAGIC + 헤더 길이(4바이트) + 헤더 JSON + 프레임들"""
+    entries = []
+    offset = 0
+    for text, fragment in fragments.items():
+        entries.append([text, fragment.sample_rate, offset, len(fragment.frames)])
+        offset += len(fragment.frames)
+    header = orjson.dumps({"voice": voice, "fragments": entries})
+    body = b"".join(fragment.frames for fragment in fragments.values())
+    return BUNDLE_MAGIC + struct.pack(">I", len(header)) + header + body
+
+
+def load_bundle(data: bytes, voice: str) -> dict:
+    """번들 -> {text: Fragment} (형식이 틀리거나 음성 설정이 다르면 ValueError)"""
+    if not data.startswith(BUNDLE_MAGIC):
+        raise ValueError("Not an audio fragment bundle")
+    start = len(BUNDLE_MAGIC) + 4
+    (header_len,) = struct.unpack(">I", data[len(BUNDLE_MAGIC):start])
+    header = orjson.loads(data[start:start + header_len])
+    if header.get("voice") != voice:
+        raise ValueError(f"Bundle voice {header.get('voice')!r} does not match {voice!r}")
+    body = data[start + header_len:]
+    return {
+        text: Fragment(body[offset:offset + length], sample_rate)
+        for text, sample_rate, offset, length in header["fragments"]
+    }
+
+
+def _split_gcs_uri(uri: str):
+    bucket, _, name = uri[len("gs://"):].partition("/")
+    return bucket, name
+
+
+def read_bundle(uri: str) -> Optional[bytes]:
+    """번들 읽기 (로컬 경로 또는 gs://bucket/object, 없으면 None)"""
+    if uri.startswith("gs://"):
+        bucket, name = _split_gcs_uri(uri)
+        blob = storage.Client().bucket(bucket).blob(name)
+        return blob.download_as_bytes() if blob.exists() else None
+    if not os.path.isfile(uri):
+        return None
+    with open(uri, "rb") as f:
+        return f.read()
+
+
+def write_bundle(uri: str, data: bytes):
+    if uri.startswith("gs://"):
+        bucket, name = _split_gcs_uri(uri)
+        storage.Client().bucket(bucket).blob(name).upload_from_string(data, content_type="application/octet-stream")
+        return
+    os.makedirs(os.path.dirname(uri) or ".", exist_ok=True)
+    with open(uri, "wb") as f:
+        f.write(data)
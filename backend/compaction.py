@@ -0,0 +1,222 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from google.api_core.exceptions import FailedPrecondition
+from google.cloud import firestore as google_firestore
+
+# 세션/히스토리 압축(Compaction) 작업
+#
+# 끝났거나(새 세션으로 대체됨) 오래 쉬고 있는 세션과 그 history 문서를
+# 사용자별 요약 문서(user_summaries/{user_id})로 합친 뒤, 원본 문서에
+# expire_at 을 찍어 보존 기간이 지나면 삭제되도록 합니다.
+#
+# Firestore TTL 정책을 sessions / history 컬렉션의 expire_at 필드에 걸어두면
+# 삭제는 Firestore가 무료로 처리합니다. TTL 정책이 없는 환경에서는
+# purge_expired() (--purge)로 직접 지울 수 있습니다.
+
+# Retention Policy (환경 변수로 관리)
+SESSION_IDLE_HOURS = float(os.getenv("COMPACTION_IDLE_HOURS", "24"))
+SESSION_GRACE_MINUTES = float(os.getenv("COMPACTION_GRACE_MINUTES", "30"))
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "30"))
+MAX_SESSIONS_PER_RUN = int(os.getenv("COMPACTION_MAX_SESSIONS", "500"))
+
+SUMMARY_COLLECTION = "user_summaries"
+# Firestore batch 는 최대 500 writes
+BATCH_LIMIT = 450
+
+
+def retention_expiry(now: datetime = None) -> datetime:
+    """보존 기간이 끝나는 시각 (expire_at 필드 값)"""
+    now = now or datetime.now(timezone.utc)
+    return now + timedelta(days=RETENTION_DAYS)
+
+
+def summarize_history(history_docs):
+    """history 문서들을 레벨별 시도/정답 수로 집계"""
+    level_stats = {}
+    for doc in history_docs:
+        data = doc.to_dict()
+        # level 필드가 없는 예전 문서는 'unknown' 으로 모읍니다.
+        level_key = str(data.get("level", "unknown"))
+        stats = level_stats.setdefault(level_key, {"attempts": 0, "correct": 0})
+        stats["attempts"] += 1
+        if data.get("is_correct"):
+            stats["correct"] += 1
+    return level_stats
+
+
+def fold_session(db, session_doc, expire_at: datetime) -> bool:
+    """세션 하나를 사용자 요약 문서에 합치고 원본에 만료 시각을 기록"""
+    session_data = session_doc.to_dict()
+    user_id = session_data.get("user_id")
+    if not user_id:
+        return False
+
+    # 이전 압축 이후 새로 쌓인 history 만 집계 (이어하기로 재개된 세션 대응)
+    # folded_until 이 없는 예전 압축 세션은 expire_at 표시로 구분합니다.
+    folded_until = session_data.get("folded_until")
+    history_docs = []
+    for h in db.collection("history").where("session_id", "==", session_doc.id).stream():
+        data = h.to_dict()
+        if folded_until is not None:
+            if data.get("timestamp") and data["timestamp"] > folded_until:
+                history_docs.append(h)
+        elif "expire_at" not in data:
+            history_docs.append(h)
+    level_stats = summarize_history(history_docs)
+    timestamps = [h.to_dict().get("timestamp") for h in history_docs]
+    latest = max((t for t in timestamps if t), default=folded_until)
+
+    total_stickers = session_data.get("total_stickers", 0)
+    sticker_delta = total_stickers - session_data.get("folded_stickers", 0)
+    first_fold = "folded_stickers" not in session_data
+
+    summary_update = {
+        "user_id": user_id,
+        "max_level": google_firestore.Maximum(session_data.get("current_level", 1)),
+        "total_stickers": google_firestore.Increment(sticker_delta),
+        "sessions_compacted": google_firestore.Increment(1 if first_fold else 0),
+        "last_compacted_at": google_firestore.SERVER_TIMESTAMP,
+        "level_stats": {
+            level_key: {
+                "attempts": google_firestore.Increment(stats["attempts"]),
+                "correct": google_firestore.Increment(stats["correct"]),
+            }
+            for level_key, stats in level_stats.items()
+        },
+    }
+
+    # 요약/세션 갱신을 먼저 한 batch 로 커밋 (folded_until 로 어디까지 합쳤는지 기록)
+    # 읽은 뒤 새 제출이 있었으면 세션 갱신이 precondition 으로 거부되어 batch 전체가 취소됩니다.
+    session_update = {
+        "compacted": True,
+        "compacted_at": google_firestore.SERVER_TIMESTAMP,
+        "folded_stickers": total_stickers,
+        "expire_at": expire_at,
+    }
+    if latest is not None:
+        session_update["folded_until"] = latest
+    batch = db.batch()
+    batch.set(db.collection(SUMMARY_COLLECTION).document(user_id), summary_update, merge=True)
+    batch.update(session_doc.reference, session_update,
+                 option=db.write_option(last_update_time=session_doc.update_time))
+    batch.commit()
+
+    # history 만료 표시는 보존 기간용이라 요약 커밋 이후에 (실패해도 다음 압축에서 중복 집계되지 않음)
+    history_refs = [h.reference for h in history_docs]
+    try:
+        for start in range(0, len(history_refs), BATCH_LIMIT):
+            batch = db.batch()
+            for ref in history_refs[start:start + BATCH_LIMIT]:
+                batch.update(ref, {"expire_at": expire_at})
+            batch.commit()
+    except Exception as e:
+        print(f"⚠️ History expiry marking failed for session {session_doc.id}: {e}")
+    return True
+
+
+def run_compaction(db, now: datetime = None, max_sessions: int = MAX_SESSIONS_PER_RUN) -> dict:
+    """끝났거나 유휴 상태인 세션을 찾아 압축"""
+    now = now or datetime.now(timezone.utc)
+    grace_cutoff = now - timedelta(minutes=SESSION_GRACE_MINUTES)
+    idle_cutoff = now - timedelta(hours=SESSION_IDLE_HOURS)
+    expire_at = retention_expiry(now)
+
+    stats = {"scanned": 0, "compacted": 0, "skipped_active": 0, "failed": 0}
+    last_session_cache = {}
+
+    # 압축된 세션은 compacted=True 라 스캔에서 빠지고, 새 제출이 있으면 다시 False 가 됩니다.
+    # (복합 색인: sessions (compacted, last_activity), 저장소 루트 firestore.indexes.json)
+    candidates = (
+        db.collection("sessions")
+        .where("compacted", "==", False)
+        .where("last_activity", "<", grace_cutoff)
+        .order_by("last_activity")
+        .limit(max_sessions)
+        .stream()
+    )
+
+    for session_doc in candidates:
+        stats["scanned"] += 1
+        data = session_doc.to_dict()
+
+        user_id = data.get("user_id")
+        if user_id not in last_session_cache:
+            user_doc = db.collection("users").document(user_id).get() if user_id else None
+            last_session_cache[user_id] = (
+                user_doc.to_dict().get("last_session_id") if user_doc and user_doc.exists else None
+            )
+
+        # 새 세션으로 대체된 세션은 끝난 것, 마지막 세션은 오래 쉬었을 때만 압축
+        superseded = last_session_cache[user_id] != session_doc.id
+        last_activity = data.get("last_activity")
+        if not superseded and last_activity and last_activity >= idle_cutoff:
+            stats["skipped_active"] += 1
+            continue
+
+        try:
+            if fold_session(db, session_doc, expire_at):
+                stats["compacted"] += 1
+        except FailedPrecondition:
+            # 스캔 이후 제출이 들어온 세션 (다음 실행에서 다시 판단)
+            stats["skipped_active"] += 1
+        except Exception as e:
+            stats["failed"] += 1
+            print(f"⚠️ Compaction failed for session {session_doc.id}: {e}")
+
+    print(f"🗜️ [Compaction] {stats}")
+    return stats
+
+
+def backfill_compacted_flag(db, batch_size: int = BATCH_LIMIT) -> int:
+    """compacted 필드가 없는 예전 세션에 값 채우기 (한 번만 실행)"""
+    updated = 0
+    batch = db.batch()
+    pending = 0
+    for doc in db.collection("sessions").select(["compacted", "compacted_at"]).stream():
+        data = doc.to_dict()
+        if "compacted" in data:
+            continue
+        batch.update(doc.reference, {"compacted": bool(data.get("compacted_at"))})
+        pending += 1
+        updated += 1
+        if pending >= batch_size:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+    print(f"🏷️ [Compaction] compacted flag backfilled on {updated} sessions")
+    return updated
+
+
+def purge_expired(db, collections=("sessions", "history"), now: datetime = None, batch_size: int = BATCH_LIMIT) -> int:
+    """TTL 정책이 없는 환경용: expire_at 이 지난 문서를 직접 삭제"""
+    now = now or datetime.now(timezone.utc)
+    deleted = 0
+    for name in collections:
+        while True:
+            docs = list(db.collection(name).where("expire_at", "<", now).limit(batch_size).stream())
+            if not docs:
+                break
+            batch = db.batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            batch.commit()
+            deleted += len(docs)
+    print(f"🗑️ [Retention] {deleted} expired documents deleted")
+    return deleted
+
+
+if __name__ == "__main__":
+    # Cloud Run Job / 로컬 실행: python compaction.py [--backfill] [--purge]
+    PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
+    db_name = os.getenv("FIRESTORE_DB_NAME", "math-ai")
+    client = google_firestore.Client(project=PROJECT_ID, database=db_name)
+    print(f"✅ Connected to Firestore database: {db_name}")
+
+    if "--backfill" in sys.argv:
+        backfill_compacted_flag(client)
+    run_compaction(client)
+    if "--purge" in sys.argv:
+        purge_expired(client)
@@ -0,0 +1,208 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+# 문제 식 컴파일러
+#
+# "3 + 2", "2 + ? = 5", "12 - 3 + 4", "? - 3 = 4" 같은 문제 문자열을
+# 작은 AST(부호가 붙은 항들의 튜플)로 파싱합니다. 덧셈/뺄셈만 있으므로
+# 식은 항상 "항들의 합" 으로 표현되고, 빈칸('?')은 값이 None 인 항입니다.
+# 파싱 결과는 불변(NamedTuple)이라 LRU 캐시로 재사용합니다.
+
+PARSE_CACHE_SIZE = 4096
+
+TOKEN_PATTERN = re.compile(r"\s*(?:(\d+)|([+\-?=]))")
+# 전각/유니코드 기호를 ASCII 로 정규화
+NORMALIZE_TABLE = str.maketrans({"−": "-", "－": "-", "＋": "+", "＝": "=", "？": "?"})
+
+
+class ExpressionError(ValueError):
+    """문제 문자열을 해석할 수 없을 때"""
+
+
+class Term(NamedTuple):
+    sign: int              # +1 / -1
+    value: Optional[int]   # None 이면 빈칸('?')
+
+
+class ProblemExpr(NamedTuple):
+    lhs: Tuple[Term, ...]
+    rhs: Tuple[Term, ...] = ()   # '=' 가 없으면 빈 튜플
+
+    @property
+    def has_blank(self) -> bool:
+        return any(t.value is None for t in self.lhs + self.rhs)
+
+    @property
+    def is_equation(self) -> bool:
+        return bool(self.rhs)
+
+
+def _tokenize(text: str):
+    text = text.translate(NORMALIZE_TABLE).strip()
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = TOKEN_PATTERN.match(text, pos)
+        if not match:
+            raise ExpressionError(f"Unexpected character at {pos}: {text!r}")
+        number, symbol = match.groups()
+        tokens.append(int(number) if number is not None else symbol)
+        pos = match.end()
+    return tokens
+
+
+def _parse_side(tokens) -> Tuple[Term, ...]:
+    """operand (op operand)* 형태의 한 변을 파싱"""
+    if not tokens:
+        raise ExpressionError("Empty expression")
+
+    terms = []
+    sign = 1
+    expect_operand = True
+    for token in tokens:
+        if expect_operand:
+            if isinstance(token, int):
+                terms.append(Term(sign, token))
+            elif token == "?":
+                terms.append(Term(sign, None))
+            else:
+                raise ExpressionError(f"Expected number or '?', got {token!r}")
+        else:
+            if token not in ("+", "-"):
+                raise ExpressionError(f"Expected '+' or '-', got {token!r}")
+            sign = 1 if token == "+" else -1
+        expect_operand = not expect_operand
+
+    if expect_operand:
+        raise ExpressionError("Expression ends with an operator")
+    return tuple(terms)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_problem(text: str) -> ProblemExpr:
+    """문제 문자열 -> ProblemExpr (결과는 캐시됨)"""
+    tokens = _tokenize(text)
+    if tokens.count("=") > 1:
+        raise ExpressionError(f"Too many '=': {text!r}")
+    if tokens.count("?") > 1:
+        raise ExpressionError(f"Only one blank is supported: {text!r}")
+
+    if "=" in tokens:
+        split_at = tokens.index("=")
+        expr = ProblemExpr(_parse_side(tokens[:split_at]), _parse_side(tokens[split_at + 1:]))
+    else:
+        expr = ProblemExpr(_parse_side(tokens))
+
+    if expr.has_blank and not expr.is_equation:
+        raise ExpressionError(f"Blank without '=' cannot be solved: {text!r}")
+    return expr
+
+
+def _coerce(problem) -> ProblemExpr:
+    return problem if isinstance(problem, ProblemExpr) else parse_problem(problem)
+
+
+def _sum(terms, blank_value: int = 0) -> int:
+    return sum(t.sign * (blank_value if t.value is None else t.value) for t in terms)
+
+
+def solve_blank(problem) -> int:
+    """빈칸('?')에 들어갈 값"""
+    expr = _coerce(problem)
+    if not expr.has_blank:
+        raise ExpressionError("Problem has no blank")
+
+    # lhs - rhs = 0 은 빈칸에 대해 1차식: known + coef * blank = 0 (coef 는 ±1)
+    known = _sum(expr.lhs) - _sum(expr.rhs)
+    blank_term = next(t for t in expr.lhs + expr.rhs if t.value is None)
+    coef = blank_term.sign if blank_term in expr.lhs else -blank_term.sign
+    return -known * coef
+
+
+def solve_problem(problem) -> int:
+    """문제의 정답 (빈칸 문제는 빈칸 값, 일반 문제는 계산 결과)"""
+    expr = _coerce(problem)
+    if expr.has_blank:
+        return solve_blank(expr)
+    return _sum(expr.lhs)
+
+
+def fill_blank(problem) -> ProblemExpr:
+    """빈칸을 정답으로 채운 식"""
+    expr = _coerce(problem)
+    if not expr.has_blank:
+        return expr
+    value = solve_blank(expr)
+
+    def fill(terms):
+        return tuple(Term(t.sign, value) if t.value is None else t for t in terms)
+
+    return ProblemExpr(fill(expr.lhs), fill(expr.rhs))
+
+
+def format_terms(terms) -> str:
+    parts = []
+    for i, t in enumerate(terms):
+        operand = "?" if t.value is None else str(t.value)
+        if i == 0:
+            parts.append(operand if t.sign > 0 else f"-{operand}")
+        else:
+            parts.append(f"{'+' if t.sign > 0 else '-'} {operand}")
+    return " ".join(parts)
+
+
+def visual_terms(problem) -> Tuple[Term, ...]:
+    """시각화에 쓸 변 (빈칸을 채운 뒤, 항이 여러 개인 쪽)"""
+    expr = fill_blank(problem)
+    if len(expr.lhs) == 1 and len(expr.rhs) > 1:
+        return expr.rhs
+    return expr.lhs
+
+
+def visual_problem(problem) -> str:
+    """시각화용 문제 문자열 (예: "2 + ? = 5" -> "2 + 3")"""
+    return format_terms(visual_terms(problem))
+
+
+def visual_operands(problem) -> dict:
+    """시각화용 두 피연산자 (세 항 이상이면 앞쪽을 먼저 계산해 두 항으로 줄임)"""
+    terms = visual_terms(problem)
+    if len(terms) == 1:
+        return {"count1": _sum(terms), "count2": 0, "operator": "+"}
+
+    last = terms[-1]
+    return {
+        "count1": _sum(terms[:-1]),
+        "count2": last.value,
+        "operator": "+" if last.sign > 0 else "-",
+    }
+
+
+def skill_tags(problem) -> list:
+    """문제 은행 필터용 기술 태그 (예: ["addition", "carry"])"""
+    expr = _coerce(problem)
+    operands = visual_terms(expr)
+    tags = []
+
+    if any(t.sign > 0 for t in operands[1:]):
+        tags.append("addition")
+    if any(t.sign < 0 for t in operands[1:]):
+        tags.append("subtraction")
+    if any(t.value >= 10 for t in operands):
+        tags.append("two_digit")
+    if len(operands) > 2:
+        tags.append("multi_step")
+    if expr.has_blank:
+        tags.append("blank")
+
+    # 받아올림/받아내림: 앞에서부터 계산하며 일의 자리가 넘치거나 모자라는 경우
+    running = operands[0].value
+    for t in operands[1:]:
+        ones = running % 10 + t.sign * (t.value % 10)
+        if ones >= 10 and "carry" not in tags:
+            tags.append("carry")
+        if ones < 0 and "borrow" not in tags:
+            tags.append("borrow")
+        running += t.sign * t.value
+    return tags
@@ -0,0 +1,118 @@
+import os
+import time
+import threading
+import grpc
+
+# 장기 유지 gRPC 채널 관리
+#
+# Dialogflow / TTS / Speech 클라이언트를 서비스별로 한 번만 만들고
+# (채널 + TLS 핸드셰이크 1회) 모든 요청에서 재사용합니다.
+# keepalive 로 유휴 연결이 끊기지 않게 하고, 시작 시 warm_up() 으로
+# 첫 요청 전에 연결을 맺어 둡니다.
+# 채널 연결 상태 변화를 구독해 실제로 다시 연결된 횟수(READY 진입)를 셉니다.
+
+GRPC_KEEPALIVE_MS = int(os.getenv("GRPC_KEEPALIVE_MS", "60000"))
+GRPC_KEEPALIVE_TIMEOUT_MS = int(os.getenv("GRPC_KEEPALIVE_TIMEOUT_MS", "10000"))
+GRPC_WARMUP_TIMEOUT = float(os.getenv("GRPC_WARMUP_TIMEOUT", "5"))
+
+GRPC_CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_MS),
+    ("grpc.keepalive_timeout_ms", GRPC_KEEPALIVE_TIMEOUT_MS),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.max_send_message_length", -1),
+    ("grpc.max_receive_message_length", -1),
+]
+
+
+class ChannelPool:
+    """서비스별 장기 유지 gRPC 채널/클라이언트 모음"""
+
+    def __init__(self, options=GRPC_CHANNEL_OPTIONS):
+        self.options = options
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, client_cls, host: str):
+        """채널을 직접 만들어 클라이언트에 주입 (이미 있으면 기존 클라이언트 반환)"""
+        with self._lock:
+            if name in self._entries:
+                return self._entries[name]["client"]
+
+            transport_cls = client_cls.get_transport_class("grpc")
+            channel = transport_cls.create_channel(host, options=self.options)
+            client = client_cls(transport=transport_cls(host=host, channel=channel))
+            entry = {
+                "client": client,
+                "channel": channel,
+                "host": host,
+                "created_at": time.time(),
+                "calls": 0,
+                "warmups": 0,
+                "last_warmup_ms": None,
+                "state": None,
+                "state_changed_at": None,
+                "connects": 0,
+                "disconnects": 0,
+            }
+            self._entries[name] = entry
+        # 연결을 새로 시작하지 않고 상태 변화만 구독 (콜백은 gRPC 스레드에서 호출됨)
+        channel.subscribe(lambda state: self._on_state_change(entry, state), try_to_connect=False)
+        return client
+
+    def _on_state_change(self, entry: dict, state: grpc.ChannelConnectivity):
+        with self._lock:
+            previous = entry["state"]
+            if state == previous:
+                return
+            if state == grpc.ChannelConnectivity.READY:
+                entry["connects"] += 1
+            elif previous == grpc.ChannelConnectivity.READY:
+                # idle timeout / GOAWAY / 네트워크 끊김 등으로 연결을 잃음
+                entry["disconnects"] += 1
+            entry["state"] = state
+            entry["state_changed_at"] = time.time()
+
+    def record_call(self, name: str):
+        with self._lock:
+            if name in self._entries:
+                self._entries[name]["calls"] += 1
+
+    def warm_up(self, timeout: float = GRPC_WARMUP_TIMEOUT) -> dict:
+        """모든 채널의 연결(TLS 포함)을 미리 맺음"""
+        results = {}
+        for name, entry in list(self._entries.items()):
+            start = time.perf_counter()
+            try:
+                grpc.channel_ready_future(entry["channel"]).result(timeout=timeout)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                with self._lock:
+                    entry["warmups"] += 1
+                    entry["last_warmup_ms"] = round(elapsed_ms, 1)
+                results[name] = "ready"
+            except grpc.FutureTimeoutError:
+                results[name] = "timeout"
+        print(f"🔥 [gRPC Warm-up] {results}")
+        return results
+
+    def stats(self) -> dict:
+        """채널 재사용 통계 (튜닝용)"""
+        now = time.time()
+        with self._lock:
+            return {
+                name: {
+                    "host": entry["host"],
+                    "uptime_seconds": round(now - entry["created_at"], 1),
+                    "calls": entry["calls"],
+                    "state": entry["state"].name if entry["state"] else None,
+                    "state_age_seconds": round(now - entry["state_changed_at"], 1) if entry["state_changed_at"] else None,
+                    # 연결(READY 진입) 횟수: 첫 연결 이후는 모두 재연결
+                    "connects": entry["connects"],
+                    "reconnects": max(entry["connects"] - 1, 0),
+                    "disconnects": entry["disconnects"],
+                    "calls_per_connection": round(entry["calls"] / entry["connects"], 1) if entry["connects"] else None,
+                    "warmups": entry["warmups"],
+                    "last_warmup_ms": entry["last_warmup_ms"],
+                }
+                for name, entry in self._entries.items()
+            }
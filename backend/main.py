@@ -1,18 +1,36 @@
 import os
-import json
+import re
+import time
 import uuid
 import random
 import base64
-from typing import Optional
-from fastapi import FastAPI, HTTPException, UploadFile, File
+import asyncio
+import threading
+import orjson
+from contextlib import asynccontextmanager
+from cachetools import LRUCache, TTLCache
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Header, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, FileResponse, ORJSONResponse
+from pydantic import BaseModel, Field
+from starlette.datastructures import UploadFile
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
 from google.cloud import firestore as google_firestore
 from google.cloud import dialogflowcx_v3
 from google.cloud import texttospeech
 from google.cloud import speech
+from audio_fragments import FragmentLibrary, NUMBER_FRAGMENTS, template_literals, load_bundle, read_bundle
+from audio_preprocess import preprocess_for_recognition, TARGET_SAMPLE_RATE
+from compaction import run_compaction, retention_expiry, BATCH_LIMIT
+from expression import ExpressionError, parse_problem, solve_problem, visual_problem as format_visual_problem, visual_operands
+from grpc_channels import ChannelPool
+from problem_tokens import ProblemClaims, ProblemTokenError, issue_token, verify_token, tokens_enabled, ALLOW_UNSIGNED_SUBMISSIONS
+from progression import apply_result, settle_level, Progress, MAX_LEVEL, STICKERS_PER_LEVEL
+from profiling import ProfilingMiddleware, profiling_enabled, list_profiles, profile_path
+from serialization import CompressionMiddleware, PrecomputedJSON, sse_event
 
 # 2. Firebase & Vertex AI 초기화
 print("🚀 Backend Version 2.0 Started")
@@ -51,21 +69,52 @@ except Exception as e:
 
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 첫 요청 전에 gRPC 연결을 맺고 음성 조각 번들을 읽어 둠 (시작을 막지 않도록 백그라운드 실행)
+    app.state.channel_warmup = asyncio.create_task(asyncio.to_thread(channel_pool.warm_up))
+    app.state.fragment_warmup = asyncio.create_task(asyncio.to_thread(warm_up_fragments))
+    yield
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# gRPC 채널 풀 (서비스별 장기 유지 채널, keepalive)
+channel_pool = ChannelPool()
 
 # Dialogflow CX Client 초기화
 try:
-    client_options = None
+    api_endpoint = "dialogflow.googleapis.com:443"
     if AGENT_LOCATION != "global":
         api_endpoint = f"{AGENT_LOCATION}-dialogflow.googleapis.com:443"
-        client_options = {"api_endpoint": api_endpoint}
     
-    session_client = dialogflowcx_v3.SessionsClient(client_options=client_options)
+    session_client = channel_pool.register("dialogflow", dialogflowcx_v3.SessionsClient, api_endpoint)
     print(f"✅ Dialogflow CX Client Initialized (Agent: {AGENT_ID})")
 except Exception as e:
     print(f"❌ Dialogflow CX Client Init Failed: {e}")
     session_client = None
 
+# 사용자별 Agent 세션 재사용 (대화 맥락 유지, TTL 동안 같은 세션 사용)
+AGENT_SESSION_TTL_SECONDS = int(os.getenv("AGENT_SESSION_TTL_SECONDS", "1200"))
+agent_sessions = TTLCache(maxsize=10000, ttl=AGENT_SESSION_TTL_SECONDS)
+agent_session_stats = {"created": 0, "reused": 0}
+agent_session_lock = threading.Lock()
+
+def agent_session_for(user_id: Optional[str]) -> str:
+    """사용자의 Agent 세션 ID (없거나 만료되면 새로 생성)"""
+    if not user_id:
+        return str(uuid.uuid4())
+    
+    with agent_session_lock:
+        agent_session_id = agent_sessions.get(user_id)
+        if agent_session_id is None:
+            agent_session_id = str(uuid.uuid4())
+            agent_session_stats["created"] += 1
+        else:
+            agent_session_stats["reused"] += 1
+        # 사용할 때마다 TTL 연장
+        agent_sessions[user_id] = agent_session_id
+    return agent_session_id
+
 def call_agent(session_id: str, text: str):
     if not session_client:
         return None
@@ -81,6 +130,7 @@ def call_agent(session_id: str, text: str):
     )
     
     try:
+        channel_pool.record_call("dialogflow")
         response = session_client.detect_intent(request=request)
         return response.query_result.response_messages
     except Exception as e:
@@ -89,34 +139,62 @@ def call_agent(session_id: str, text: str):
 
 # Speech Client 초기화
 try:
-    speech_client = speech.SpeechClient()
+    speech_client = channel_pool.register("speech", speech.SpeechClient, "speech.googleapis.com:443")
     print("✅ Speech Client Initialized")
 except Exception as e:
     print(f"❌ Speech Client Init Failed: {e}")
     speech_client = None
 
+# TTS Client 초기화 (요청마다 새로 만들지 않고 채널 재사용)
+try:
+    tts_client = channel_pool.register("tts", texttospeech.TextToSpeechClient, "texttospeech.googleapis.com:443")
+    print("✅ TTS Client Initialized")
+except Exception as e:
+    print(f"❌ TTS Client Init Failed: {e}")
+    tts_client = None
+
+# TTS 음성 설정 (바뀌면 예전 음성 조각 번들은 무시됨)
+TTS_VOICE_NAME = "ko-KR-Neural2-C"
+TTS_SPEAKING_RATE = 0.9
+TTS_PITCH = 1.0
+TTS_VOICE_KEY = f"{TTS_VOICE_NAME}/mp3/{TTS_SPEAKING_RATE}/{TTS_PITCH}"
+
 # TTS Helper Function
-def synthesize_text(text: str) -> Optional[str]:
+def synthesize_audio(text: str) -> Optional[bytes]:
+    """TTS MP3 바이트"""
+    if not tts_client:
+        return None
     try:
-        client = texttospeech.TextToSpeechClient()
+        channel_pool.record_call("tts")
         input_text = texttospeech.SynthesisInput(text=text)
         voice = texttospeech.VoiceSelectionParams(
             language_code="ko-KR",
-            name="ko-KR-Neural2-C",
+            name=TTS_VOICE_NAME,
         )
         audio_config = texttospeech.AudioConfig(
             audio_encoding=texttospeech.AudioEncoding.MP3,
-            speaking_rate=0.9,
-            pitch=1.0
+            speaking_rate=TTS_SPEAKING_RATE,
+            pitch=TTS_PITCH
         )
-        response = client.synthesize_speech(
+        response = tts_client.synthesize_speech(
             request={"input": input_text, "voice": voice, "audio_config": audio_config}
         )
-        return base64.b64encode(response.audio_content).decode("utf-8")
+        return response.audio_content
     except Exception as e:
         print(f"⚠️ TTS Error: {e}")
         return None
 
+def synthesize_text(text: str) -> Optional[str]:
+    audio = synthesize_audio(text)
+    return base64.b64encode(audio).decode("utf-8") if audio else None
+
+# 문장 끝(. ! ? …) 뒤의 공백에서 나눔
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…~])\s+")
+
+def split_sentences(text: str) -> list:
+    """TTS 파이프라인용 문장 분리"""
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
 # 3. CORS 설정
 allowed_origins_env = os.getenv("ALLOWED_ORIGINS")
 if allowed_origins_env:
@@ -140,6 +218,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 응답 압축 (JSON 등 텍스트 응답만, COMPRESSION_MIN_BYTES 이상일 때)
+app.add_middleware(CompressionMiddleware)
+
+# 요청 프로파일링 (PROFILE_SAMPLE_RATE / PROFILE_TOKEN 이 있을 때만 등록)
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+    print("🔬 Request profiling enabled")
+
 # 4. Constants (Leveling Rules)
 LEVEL_GUIDES = {
     1: "합이 10 이하인 한 자릿수 덧셈 (예: 3 + 2)",
@@ -149,11 +235,108 @@ LEVEL_GUIDES = {
     5: "1부터 20까지의 수로 이루어진 혼합 산수 (덧셈/뺄셈)"
 }
 
+TIMEOUT_MESSAGE = "시간이 다 됐어요! 선생님이랑 같이 풀어볼까요?"
+# 이름/숫자만 바뀌는 문장은 조각을 이어 붙여 음성 생성 (audio_fragments)
+CORRECT_TEMPLATE = "정답은 {answer}! 참 잘했어요!"
+FALLBACK_TEMPLATE = "{user_name}, 괜찮아! 우리 다시 한 번 천천히 세어볼까?"
+
+# 인스턴스 로컬 캐시 (고정 문구 TTS)
+phrase_audio_cache = LRUCache(maxsize=64)
+local_cache_lock = threading.Lock()
+
+# 문제 은행 무작위 샘플링
+# - 문제 문서마다 미리 뽑아 둔 rand (0~1) 와 skills 태그가 있음 (scripts/populate_problems.py)
+# - level (+ skills) + rand >= r 범위에서 rand 순으로 몇 개만 읽으므로
+#   은행 크기와 상관없이 읽기 비용이 일정 (복합 색인: 저장소 루트 firestore.indexes.json)
+PROBLEM_SAMPLE_SIZE = int(os.getenv("PROBLEM_SAMPLE_SIZE", "5"))
+PROBLEM_FIELDS = ["problem", "answer", "level", "skills"]
+
+def sample_problems(level: int, skill: Optional[str] = None, limit: int = PROBLEM_SAMPLE_SIZE) -> list:
+    """레벨(과 기술 태그)에 맞는 문제를 무작위 위치에서 limit 개 읽음"""
+    query = db.collection("problems").where("level", "==", level)
+    if skill:
+        query = query.where("skills", "array_contains", skill)
+    
+    r = random.random()
+    problems = [p.to_dict() for p in query.where("rand", ">=", r).order_by("rand").limit(limit).select(PROBLEM_FIELDS).stream()]
+    if not problems:
+        # r 이 마지막 문서보다 크면 처음으로 돌아감
+        problems = [p.to_dict() for p in query.where("rand", "<", r).order_by("rand").limit(limit).select(PROBLEM_FIELDS).stream()]
+    if not problems and not skill:
+        # rand 가 아직 없는 문서 (backfill 전)
+        problems = [p.to_dict() for p in query.limit(limit).select(PROBLEM_FIELDS).stream()]
+    return problems
+
+def synthesize_phrase(text: str) -> Optional[str]:
+    """자주 쓰는 고정 문구 TTS (성공한 결과만 캐시)"""
+    with local_cache_lock:
+        audio_base64 = phrase_audio_cache.get(text)
+    if audio_base64 is None:
+        audio_base64 = synthesize_text(text)
+        if audio_base64:
+            with local_cache_lock:
+                phrase_audio_cache[text] = audio_base64
+    return audio_base64
+
+# 음성 조각 (고정 문구 + 숫자 0~100)
+# - scripts/build_audio_fragments.py 로 한 번 합성해 둔 번들을 시작할 때 읽음 (TTS 호출 없음)
+# - 번들에 없는 조각은 처음 쓸 때 합성해 보관, 새 이름은 LRU 에 캐시
+# - FRAGMENT_PREWARM=1 이면 시작할 때 번들에 없는 조각을 모두 합성 (기본 꺼짐)
+FRAGMENT_BUNDLE_URI = os.getenv("FRAGMENT_BUNDLE_URI", os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "audio_fragments.bin"))
+FRAGMENT_PREWARM = os.getenv("FRAGMENT_PREWARM", "0") == "1"
+
+def fragment_texts() -> list:
+    """번들에 넣는 고정 조각 (템플릿 고정 문구 + 숫자)"""
+    return template_literals(CORRECT_TEMPLATE) + template_literals(FALLBACK_TEMPLATE) + list(NUMBER_FRAGMENTS)
+
+fragment_library = FragmentLibrary(synthesize_audio, pinned_texts=fragment_texts())
+
+def load_fragment_bundle():
+    try:
+        data = read_bundle(FRAGMENT_BUNDLE_URI)
+        if data is None:
+            print(f"⚠️ No audio fragment bundle at {FRAGMENT_BUNDLE_URI} (fragments are synthesized on first use)")
+            return
+        loaded = fragment_library.load(load_bundle(data, TTS_VOICE_KEY))
+        print(f"🧩 [음성 조각 번들] {loaded} fragments loaded")
+    except Exception as e:
+        print(f"⚠️ Audio fragment bundle load failed: {e}")
+
+def prewarm_fragments(texts=None):
+    texts = fragment_texts() if texts is None else texts
+    synthesized = fragment_library.prewarm(texts)
+    print(f"🧩 [음성 조각 예열] {synthesized} synthesized, {len(texts)} total")
+
+def render_template_audio(template: str, **values) -> Optional[str]:
+    """템플릿 문장 음성 (조각 조립에 실패하면 문장 전체를 합성)"""
+    audio = fragment_library.render(template, **values)
+    if audio is None:
+        return synthesize_text(template.format(**values))
+    return base64.b64encode(audio).decode("utf-8")
+
+def praise_audio(answer) -> Optional[str]:
+    return render_template_audio(CORRECT_TEMPLATE, answer=answer)
+
+def prewarm_caches():
+    """수업 시작 전에 고정 문구 TTS 와 음성 조각을 미리 채움"""
+    synthesize_phrase(TIMEOUT_MESSAGE)
+    # 숫자는 번들에 없으면 처음 쓸 때 합성 (여기서는 고정 문구만)
+    prewarm_fragments(template_literals(CORRECT_TEMPLATE) + template_literals(FALLBACK_TEMPLATE))
+    print("🔥 [캐시 예열] phrases")
+
+# 제출 중복 방지 (problem_id 기준)
+# - 세션 문서에는 최근 problem_id 목록만 유지 (인스턴스 간 중복 방지)
+# - 인스턴스 로컬 LRU 에는 최근 응답을 보관 (재시도 시 트랜잭션 없이 응답)
+RECENT_PROBLEM_IDS_LIMIT = 20
+submit_response_cache = LRUCache(maxsize=int(os.getenv("SUBMIT_CACHE_SIZE", "512")))
+submit_cache_lock = threading.Lock()
+
 # 5. Data Models
 class QuizRequest(BaseModel):
     problem: str
     wrong_answer: str
     user_name: str
+    user_id: Optional[str] = None
 
 class UpdateLevelRequest(BaseModel):
     user_id: str
@@ -162,6 +345,7 @@ class UpdateLevelRequest(BaseModel):
 class GenerateProblemRequest(BaseModel):
     user_id: str
     session_id: str
+    skill: Optional[str] = None  # 예: "carry", "borrow" (expression.skill_tags)
 
 class SubmitResultRequest(BaseModel):
     user_id: str
@@ -172,6 +356,10 @@ class SubmitResultRequest(BaseModel):
     user_answer: str
     is_correct: bool
     source: str
+    problem_token: Optional[str] = None  # generate-problem 이 발급한 서명 토큰
+
+class SubmitAnswerRequest(SubmitResultRequest):
+    user_name: str
 
 class StartSessionRequest(BaseModel):
     user_id: str
@@ -179,7 +367,27 @@ class StartSessionRequest(BaseModel):
 class ContinueSessionRequest(BaseModel):
     user_id: str
 
+class ClassroomStudent(BaseModel):
+    user_id: str
+    level: int = Field(default=1, ge=1, le=MAX_LEVEL)
+
+class ClassroomStartRequest(BaseModel):
+    students: List[ClassroomStudent]
+    prewarm: bool = True
+
+
 
+def new_session_data(user_id: str, level: int = 1) -> dict:
+    """새 세션 문서 초기값"""
+    return {
+        "user_id": user_id,
+        "current_level": level,
+        "level_stickers": 0,
+        "total_stickers": 0,
+        "compacted": False,  # 압축 대상 스캔용 (compaction.run_compaction)
+        "created_at": firestore.SERVER_TIMESTAMP,
+        "last_activity": firestore.SERVER_TIMESTAMP
+    }
 
 @app.post("/start-session")
 async def start_session(request: StartSessionRequest):
@@ -192,16 +400,7 @@ async def start_session(request: StartSessionRequest):
         session_id = str(uuid.uuid4())
         
         # 세션 문서 생성
-        session_data = {
-            "user_id": request.user_id,
-            "current_level": 1,
-            "level_stickers": 0,
-            "total_stickers": 0,
-            "created_at": firestore.SERVER_TIMESTAMP,
-            "last_activity": firestore.SERVER_TIMESTAMP
-        }
-        
-        db.collection("sessions").document(session_id).set(session_data)
+        db.collection("sessions").document(session_id).set(new_session_data(request.user_id))
         
         # 사용자 문서 업데이트 (마지막 세션 ID 저장)
         db.collection("users").document(request.user_id).set({
@@ -251,7 +450,13 @@ async def continue_session(request: ContinueSessionRequest):
         session_data = session_doc.to_dict()
         
         # 세션 활동 시간 업데이트
-        session_ref.update({"last_activity": firestore.SERVER_TIMESTAMP})
+        activity_update = {"last_activity": firestore.SERVER_TIMESTAMP}
+        if session_data.get("compacted_at"):
+            # 압축된 세션을 이어하면 다시 활성 세션으로 되돌립니다 (만료 취소)
+            activity_update["compacted"] = False
+            activity_update["compacted_at"] = firestore.DELETE_FIELD
+            activity_update["expire_at"] = firestore.DELETE_FIELD
+        session_ref.update(activity_update)
         
         print(f"🔄 [세션 이어하기] user: {request.user_id}, session: {last_session_id}")
         
@@ -269,6 +474,59 @@ async def continue_session(request: ContinueSessionRequest):
         print(f"🔥 Continue session failed: {e}")
         return {"status": "no_history"}
 
+MAX_CLASSROOM_SIZE = int(os.getenv("MAX_CLASSROOM_SIZE", "100"))
+
+@app.post("/classroom/start")
+async def start_classroom(request: ClassroomStartRequest, background_tasks: BackgroundTasks):
+    """반 전체 세션 일괄 시작 (세션 + last_session_id 를 batch 로 기록)"""
+    if not db:
+        raise HTTPException(status_code=500, detail="Database not connected")
+    
+    # 같은 학생이 중복으로 들어오면 하나만 사용
+    students = list({s.user_id: s for s in request.students}.values())
+    if not students:
+        raise HTTPException(status_code=422, detail="Empty roster")
+    if len(students) > MAX_CLASSROOM_SIZE:
+        raise HTTPException(status_code=422, detail=f"Roster exceeds {MAX_CLASSROOM_SIZE} students")
+    
+    try:
+        sessions = []
+        batch = db.batch()
+        pending_writes = 0
+        for student in students:
+            session_id = str(uuid.uuid4())
+            batch.set(db.collection("sessions").document(session_id), new_session_data(student.user_id, student.level))
+            batch.set(db.collection("users").document(student.user_id), {
+                "last_session_id": session_id,
+                "last_activity": firestore.SERVER_TIMESTAMP
+            }, merge=True)
+            pending_writes += 2
+            
+            if pending_writes >= BATCH_LIMIT:
+                batch.commit()
+                batch = db.batch()
+                pending_writes = 0
+            
+            sessions.append({
+                "user_id": student.user_id,
+                "session_id": session_id,
+                "current_level": student.level,
+                "level_stickers": 0,
+                "total_stickers": 0
+            })
+        if pending_writes:
+            batch.commit()
+        
+        print(f"🏫 [반 세션 시작] {len(sessions)} students")
+        
+        if request.prewarm:
+            background_tasks.add_task(prewarm_caches)
+        
+        return {"sessions": sessions, "count": len(sessions)}
+    except Exception as e:
+        print(f"🔥 Classroom start failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/generate-problem")
 async def generate_problem(request: GenerateProblemRequest):
     # 1. Get Session Info (Level & Stickers)
@@ -293,12 +551,11 @@ async def generate_problem(request: GenerateProblemRequest):
     problem_data = None
     if db:
         try:
-            # Fetch all problems for this level (or a random subset if possible, but Firestore random is hard)
-            # For 30 items, fetching all IDs and picking one is fine.
-            # Optimization: Use a random offset or ID if we had sequential IDs, but here we have random IDs.
-            # Let's fetch all for the level and pick one randomly. 30 items is small.
-            problems_ref = db.collection("problems").where("level", "==", current_level).stream()
-            problems_list = [p.to_dict() for p in problems_ref]
+            # 무작위 위치에서 몇 개만 읽고 그중 하나를 선택
+            problems_list = sample_problems(current_level, request.skill)
+            if not problems_list and request.skill:
+                print(f"⚠️ [문제 은행] Level {current_level} '{request.skill}' 문제 없음. 레벨 전체에서 선택.")
+                problems_list = sample_problems(current_level)
             
             if problems_list:
                 problem_data = random.choice(problems_list)
@@ -315,16 +572,271 @@ async def generate_problem(request: GenerateProblemRequest):
             "answer": 4
         }
 
+    problem_id = str(uuid.uuid4()) # Generate a unique ID for this instance of the problem
+    token = None
+
+    # 정답은 문제 식에서 직접 계산 (해석할 수 없는 문제만 저장된 값 사용)
+    try:
+        answer = solve_problem(problem_data["problem"])
+    except ExpressionError as e:
+        print(f"⚠️ Problem parse failed, using stored answer: {e}")
+        answer = problem_data["answer"]
+
+    # 채점/레벨 정보를 서명해 두면 제출 시 세션을 다시 읽지 않아도 됨
+    if tokens_enabled():
+        token = issue_token(ProblemClaims(
+            problem_id, request.session_id, problem_data["problem"], int(answer), current_level, int(time.time())
+        ))
+
     return {
         "problem": problem_data["problem"],
-        "answer": problem_data["answer"],
+        "answer": answer,
         "level": current_level,
-        "id": str(uuid.uuid4()), # Generate a unique ID for this instance of the problem
+        "id": problem_id,
+        "token": token,
         "stickers": current_stickers,
         "total_stickers": total_stickers,
         "source": "problem_bank" if db else "fallback"
     }
 
+def verify_submission(request: SubmitResultRequest) -> Optional[ProblemClaims]:
+    """문제 토큰 검증 (토큰을 쓰지 않으면 None, 토큰이 없거나 잘못되었으면 400)"""
+    if not tokens_enabled():
+        return None
+    if not request.problem_token:
+        # 토큰을 빼면 예전 경로(클라이언트 값/트랜잭션)로 우회할 수 있으므로 거부
+        if ALLOW_UNSIGNED_SUBMISSIONS:
+            return None
+        raise HTTPException(status_code=400, detail="Missing problem token")
+    try:
+        claims = verify_token(request.problem_token)
+    except ProblemTokenError as e:
+        print(f"⚠️ Problem token rejected: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    if claims.session_id != request.session_id or claims.token_id != request.problem_id:
+        raise HTTPException(status_code=400, detail="Problem token does not match submission")
+    return claims
+
+def grade_submission(request: SubmitResultRequest, claims: Optional[ProblemClaims] = None):
+    """(정답, 정답 여부) 계산 (토큰이 있으면 토큰의 정답 사용)"""
+    if claims:
+        answer = claims.answer
+    else:
+        try:
+            answer = solve_problem(request.problem)
+        except ExpressionError as e:
+            print(f"⚠️ Problem parse failed, trusting client result: {e}")
+            return request.answer, request.is_correct
+    
+    try:
+        is_correct = int(request.user_answer.strip()) == answer
+    except ValueError:
+        # "TIMEOUT" 등 숫자가 아닌 답
+        is_correct = False
+    return answer, is_correct
+
+def record_submission(request: SubmitResultRequest, answer: int, is_correct: bool,
+                      claims: Optional[ProblemClaims] = None) -> dict:
+    """세션 진행 상황을 갱신하고 히스토리 기록 (오디오 제외, 토큰이 없으면 트랜잭션 사용)"""
+    if claims:
+        return record_submission_atomic(request, claims, is_correct)
+
+    session_ref = db.collection("sessions").document(request.session_id)
+
+    # Transaction으로 원자적 업데이트
+    @firestore.transactional
+    def update_session_stats(transaction, ref):
+        # Fix for 'generator' object has no attribute 'exists'
+        snapshot_obj = transaction.get(ref)
+        snapshot = snapshot_obj
+
+        # If it returns a generator/iterator, get the first item
+        if hasattr(snapshot_obj, '__next__') or hasattr(snapshot_obj, '__iter__'):
+            try:
+                snapshot = next(snapshot_obj)
+            except TypeError:
+                # Not actually iterable?
+                pass
+
+        if not snapshot.exists:
+            # 세션이 없으면 새로 생성
+            session_data = {
+                "user_id": request.user_id,
+                "current_level": 1,
+                "level_stickers": 0,
+                "total_stickers": 0
+            }
+        else:
+            session_data = snapshot.to_dict()
+
+        current_level = session_data.get("current_level", 1)
+        level_stickers = session_data.get("level_stickers", 0)
+        total_stickers = session_data.get("total_stickers", 0)
+        answered_level = current_level
+
+        # 다른 인스턴스에서 이미 반영된 제출이면 현재 상태만 돌려줌
+        recent_problem_ids = session_data.get("recent_problem_ids", [])
+        if request.problem_id in recent_problem_ids:
+            stats = {
+                "new_level": current_level,
+                "level_stickers": level_stickers,
+                "total_stickers": total_stickers,
+                "levelup_event": False
+            }
+            return stats, False, answered_level
+
+        # 정답인 경우 스티커 추가 (10개 모으면 레벨업)
+        current_level, level_stickers, total_stickers, levelup_event = apply_result(
+            current_level, level_stickers, total_stickers, is_correct
+        )
+        if levelup_event:
+            print(f"🆙 Level Up! session: {request.session_id} -> Lv.{current_level}")
+
+        # 세션 업데이트 (문서 존재 여부에 따라 분기)
+        update_data = {
+            "current_level": current_level,
+            "level_stickers": level_stickers,
+            "total_stickers": total_stickers,
+            "recent_problem_ids": (recent_problem_ids + [request.problem_id])[-RECENT_PROBLEM_IDS_LIMIT:],
+            # 새 기록이 생겼으므로 다시 압축 대상 (이미 합친 부분은 folded_until 이후만 집계)
+            "compacted": False,
+            "last_activity": firestore.SERVER_TIMESTAMP
+        }
+        if "expire_at" in session_data:
+            update_data["expire_at"] = firestore.DELETE_FIELD
+
+        if not snapshot.exists:
+            # 문서가 없으면 새로 생성 (user_id 등 필수 필드 포함)
+            session_data.update(update_data) # 기존 초기화 데이터에 업데이트 내용 병합
+            transaction.set(ref, session_data)
+        else:
+            # 문서가 있으면 수정
+            transaction.update(ref, update_data)
+
+        # 실제 총 스티커 개수 재집계 (Latency 문제로 인해 로컬 변수 사용)
+        # real_total_stickers = get_total_stickers(request.session_id)
+        real_total_stickers = total_stickers
+
+        stats = {
+            "new_level": current_level,
+            "level_stickers": level_stickers,
+            "total_stickers": real_total_stickers,
+            "levelup_event": levelup_event
+        }
+        return stats, True, answered_level
+
+    # 트랜잭션 본문은 재시도될 수 있으므로 히스토리 기록/TTS 는 커밋 이후에 한 번만 수행
+    response, applied, answered_level = update_session_stats(db.transaction(), session_ref)
+
+    if applied:
+        #히스토리 기록
+        try:
+            db.collection("history").add({
+                "user_id": request.user_id,
+                "session_id": request.session_id,
+                "problem_id": request.problem_id,
+                "problem": request.problem,
+                "level": answered_level,
+                "answer": answer,
+                "user_answer": request.user_answer,
+                "is_correct": is_correct,
+                "source": request.source,
+                "timestamp": firestore.SERVER_TIMESTAMP
+            })
+        except Exception as e:
+            print(f"⚠️ History logging failed: {e}")
+    
+    response["is_correct"] = is_correct
+    return response
+
+def record_submission_atomic(request: SubmitResultRequest, claims: ProblemClaims, is_correct: bool) -> dict:
+    """토큰으로 검증된 제출: 세션을 읽지 않고 Increment/Maximum 변환으로 갱신
+
+    history/{토큰 ID} 생성과 세션 갱신을 한 batch 로 커밋하므로, 같은 토큰의
+    두 번째 제출은 AlreadyExists 로 통째로 거부됩니다 (인스턴스 간 중복 방지).
+    """
+    session_ref = db.collection("sessions").document(request.session_id)
+    delta = 1 if is_correct else 0
+
+    batch = db.batch()
+    batch.create(db.collection("history").document(claims.token_id), {
+        "user_id": request.user_id,
+        "session_id": request.session_id,
+        "problem_id": claims.token_id,
+        "problem": claims.problem,
+        "level": claims.level,
+        "answer": claims.answer,
+        "user_answer": request.user_answer,
+        "is_correct": is_correct,
+        "source": request.source,
+        "timestamp": firestore.SERVER_TIMESTAMP
+    })
+    # 변환 결과(transform_results)로 갱신 후 값이 돌아오므로 오답도 Increment(0) 으로 현재 값을 받음
+    session_update = {
+        "user_id": request.user_id,
+        "compacted": False,
+        "expire_at": firestore.DELETE_FIELD,
+        "current_level": firestore.Maximum(claims.level),
+        "level_stickers": firestore.Increment(delta),
+        "total_stickers": firestore.Increment(delta),
+        "last_activity": firestore.SERVER_TIMESTAMP
+    }
+    batch.set(session_ref, session_update, merge=True)
+
+    try:
+        write_results = batch.commit()
+    except AlreadyExists:
+        # 재전송: 세션을 한 번 읽어 현재 상태를 돌려주면서 빠진 레벨업이 있으면 정산
+        print(f"♻️ [중복 토큰] session: {request.session_id}, problem: {claims.token_id}")
+        snapshot = session_ref.get()
+        data = snapshot.to_dict() or {}
+        progress = settle_session(
+            session_ref, data.get("current_level", 1), data.get("level_stickers", 0),
+            data.get("total_stickers", 0), snapshot.update_time
+        )
+        return dict(progress_response(progress), is_correct=is_correct)
+
+    # 변환은 필드 경로 순으로 적용되고 결과도 같은 순서
+    transform_fields = sorted(["current_level", "last_activity", "level_stickers", "total_stickers"])
+    values = dict(zip(transform_fields, write_results[1].transform_results))
+    progress = settle_session(
+        session_ref,
+        values["current_level"].integer_value,
+        values["level_stickers"].integer_value,
+        values["total_stickers"].integer_value,
+        write_results[1].update_time
+    )
+    return dict(progress_response(progress), is_correct=is_correct)
+
+def settle_session(session_ref, level: int, level_stickers: int, total_stickers: int, update_time) -> Progress:
+    """Increment 이후 상태의 레벨업 정산 (progression.settle_level)
+
+    레벨 스티커가 10개 이상이면 (이전 레벨업 쓰기가 빠졌어도) 레벨업을 씁니다.
+    읽은 시점 이후 다른 쓰기가 있으면 precondition 으로 거부되고,
+    그 쓰기를 한 제출이 같은 정산을 하므로 두 번 차감되지 않습니다.
+    """
+    progress = settle_level(level, level_stickers, total_stickers)
+    if not progress.levelup_event:
+        return progress
+    try:
+        session_ref.update({
+            "current_level": firestore.Maximum(progress.level),
+            "level_stickers": firestore.Increment(-STICKERS_PER_LEVEL)
+        }, option=db.write_option(last_update_time=update_time))
+    except FailedPrecondition:
+        print(f"⚠️ Level-up skipped (session changed), settled by a later submission: {session_ref.id}")
+        return Progress(level, level_stickers, total_stickers)
+    print(f"🆙 Level Up! session: {session_ref.id} -> Lv.{progress.level}")
+    return progress
+
+def progress_response(progress: Progress) -> dict:
+    return {
+        "new_level": progress.level,
+        "level_stickers": progress.level_stickers,
+        "total_stickers": progress.total_stickers,
+        "levelup_event": progress.levelup_event
+    }
+
 @app.post("/submit-result")
 async def submit_result(request: SubmitResultRequest):
     """문제 결과 제출 및 진행 상황 업데이트"""
@@ -336,227 +848,347 @@ async def submit_result(request: SubmitResultRequest):
             "levelup_event": False
         }
     
+    # 정답 여부는 서버에서 다시 채점 (토큰 > 문제 식 > 해석할 수 없으면 클라이언트 값)
+    claims = verify_submission(request)
+    answer, is_correct = grade_submission(request, claims)
+    
+    # 같은 문제의 재전송(네트워크 재시도)은 트랜잭션 없이 이전 응답을 그대로 반환
+    cache_key = (request.session_id, request.problem_id)
+    with submit_cache_lock:
+        cached_response = submit_response_cache.get(cache_key)
+    if cached_response is not None:
+        print(f"♻️ [중복 제출] session: {request.session_id}, problem: {request.problem_id}")
+        return ORJSONResponse(cached_response)
+    
     try:
-        session_ref = db.collection("sessions").document(request.session_id)
+        response = record_submission(request, answer, is_correct, claims)
+        response["audio_base64"] = praise_audio(answer) if is_correct else None
         
-        # Transaction으로 원자적 업데이트
-        @firestore.transactional
-        def update_session_stats(transaction, ref):
-            # Fix for 'generator' object has no attribute 'exists'
-            snapshot_obj = transaction.get(ref)
-            snapshot = snapshot_obj
-            
-            # If it returns a generator/iterator, get the first item
-            if hasattr(snapshot_obj, '__next__') or hasattr(snapshot_obj, '__iter__'):
-                try:
-                    snapshot = next(snapshot_obj)
-                except TypeError:
-                    # Not actually iterable?
-                    pass
-            
-            if not snapshot.exists:
-                # 세션이 없으면 새로 생성
-                session_data = {
-                    "user_id": request.user_id,
-                    "current_level": 1,
-                    "level_stickers": 0,
-                    "total_stickers": 0
-                }
-            else:
-                session_data = snapshot.to_dict()
-            
-            current_level = session_data.get("current_level", 1)
-            level_stickers = session_data.get("level_stickers", 0)
-            total_stickers = session_data.get("total_stickers", 0)
-            
-            levelup_event = False
-            
-            # 정답인 경우 스티커 추가
-            if request.is_correct:
-                level_stickers += 1
-                total_stickers += 1
-                
-                # 10개 모으면 레벨업
-                if level_stickers >= 10:
-                    if current_level < 5:
-                        current_level += 1
-                        level_stickers = 0
-                        levelup_event = True
-                        print(f"🆙 Level Up! session: {request.session_id} -> Lv.{current_level}")
-            
-            # 세션 업데이트 (문서 존재 여부에 따라 분기)
-            update_data = {
-                "current_level": current_level,
-                "level_stickers": level_stickers,
-                "total_stickers": total_stickers,
-                "last_activity": firestore.SERVER_TIMESTAMP
-            }
-
-            if not snapshot.exists:
-                # 문서가 없으면 새로 생성 (user_id 등 필수 필드 포함)
-                session_data.update(update_data) # 기존 초기화 데이터에 업데이트 내용 병합
-                transaction.set(ref, session_data)
-            else:
-                # 문서가 있으면 수정
-                transaction.update(ref, update_data)
-            
-            #히스토리 기록
-            try:
-                db.collection("history").add({
-                    "user_id": request.user_id,
-                    "session_id": request.session_id,
-                    "problem_id": request.problem_id,
-                    "problem": request.problem,
-                    "answer": request.answer,
-                    "user_answer": request.user_answer,
-                    "is_correct": request.is_correct,
-                    "source": request.source,
-                    "timestamp": firestore.SERVER_TIMESTAMP
-                })
-            except Exception as e:
-                print(f"⚠️ History logging failed: {e}")
-            
-            # 실제 총 스티커 개수 재집계 (Latency 문제로 인해 로컬 변수 사용)
-            # real_total_stickers = get_total_stickers(request.session_id)
-            real_total_stickers = total_stickers
-            
-            return {
-                "new_level": current_level,
-                "level_stickers": level_stickers,
-                "total_stickers": real_total_stickers,
-                "levelup_event": levelup_event,
-                "audio_base64": synthesize_text("정답입니다! 참 잘했어요!") if request.is_correct else None
-            }
+        with submit_cache_lock:
+            submit_response_cache[cache_key] = response
         
-        return update_session_stats(db.transaction(), session_ref)
+        # audio_base64 가 포함된 큰 응답이라 jsonable_encoder 를 거치지 않고 바로 직렬화
+        return ORJSONResponse(response)
     
     except Exception as e:
         print(f"🔥 Submit result failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/explain-error")
-async def explain_error(request: QuizRequest):
-    if not session_client:
-        raise HTTPException(status_code=500, detail="Agent client not initialized")
-
-    print(f"📥 [오답 설명 요청] {request.user_name}: {request.problem} (답: {request.wrong_answer})")
-    
-    # Log to Firestore
-    if db:
-        try:
-            db.collection("history").add({
-                "type": "explanation_request",
-                "user_name": request.user_name,
-                "problem": request.problem,
-                "wrong_answer": request.wrong_answer,
-                "timestamp": firestore.SERVER_TIMESTAMP
-            })
-        except Exception as e:
-            print(f"⚠️ Firestore Error (Skipping DB): {e}")
+def log_explanation_request(request: QuizRequest):
+    """오답 설명 요청을 history 에 기록"""
+    if not db:
+        return
+    try:
+        db.collection("history").add({
+            "type": "explanation_request",
+            "user_name": request.user_name,
+            "problem": request.problem,
+            "wrong_answer": request.wrong_answer,
+            "timestamp": firestore.SERVER_TIMESTAMP,
+            # 세션에 묶이지 않는 기록이라 작성 시점에 보존 기한을 지정
+            "expire_at": retention_expiry()
+        })
+    except Exception as e:
+        print(f"⚠️ Firestore Error (Skipping DB): {e}")
 
+def request_explanation(request: QuizRequest) -> dict:
+    """Agent에게 오답 설명을 요청하고 응답을 파싱 (오디오 제외)"""
     # Agent에게 보낼 메시지 구성
     user_input = f"문제: {request.problem}, 학생 답: {request.wrong_answer}, 학생 이름: {request.user_name}"
     
     # 탐정 모드 감지 (문제에 '?'가 포함된 경우)
     is_detective = "?" in request.problem
     visual_problem = request.problem # 시각화를 위한 변환된 문제 (예: 2 + 3)
+    operands = None
 
-    if is_detective:
-        try:
+    try:
+        expr = parse_problem(request.problem)
+        operands = visual_operands(expr)
+        
+        if expr.has_blank:
             # "2 + ? = 5" -> "2 + 3" 형태로 변환하여 시각화에 사용
-            # 1. 파싱
-            parts = request.problem.split() # ['2', '+', '?', '=', '5']
-            if len(parts) >= 5:
-                num1 = int(parts[0])
-                operator = parts[1]
-                result = int(parts[4])
-                
-                # 숨겨진 숫자(정답) 계산
-                hidden_num = 0
-                if operator == '+':
-                    hidden_num = result - num1
-                elif operator == '-':
-                    hidden_num = num1 - result
-                
-                # 시각화용 문제 재구성 (2 + 3)
-                visual_problem = f"{num1} {operator} {hidden_num}"
-                
-                # 프롬프트 강화
-                user_input += f". 이것은 빈칸 채우기 문제입니다 (예: {request.problem}). 빈칸에 들어갈 정답이 {hidden_num}이라는 것을 설명해주세요. 전체 개수 {result}에서 {num1}을 {operator == '+' and '빼면' or '생각하면'} 알 수 있다는 식으로 설명해주세요."
-        except Exception as e:
-            print(f"⚠️ Detective mode explanation prep failed: {e}")
+            hidden_num = solve_problem(expr)
+            visual_problem = format_visual_problem(expr)
+            
+            # 프롬프트 강화
+            user_input += f". 이것은 빈칸 채우기 문제입니다 (예: {request.problem}). 빈칸에 들어갈 정답이 {hidden_num}이라는 것을 설명해주세요."
+            
+            # "a + ? = r" / "a - ? = r" 형태는 전체 개수에서 생각하는 방법까지 안내
+            if len(expr.lhs) == 2 and len(expr.rhs) == 1 and expr.lhs[1].value is None:
+                num1 = expr.lhs[0].value
+                result = expr.rhs[0].value
+                user_input += f" 전체 개수 {result}에서 {num1}을 {'빼면' if expr.lhs[1].sign > 0 else '생각하면'} 알 수 있다는 식으로 설명해주세요."
+    except ExpressionError as e:
+        print(f"⚠️ Problem parse failed for explanation: {e}")
+
+    # 사용자별 Agent 세션 재사용 (user_id 가 없으면 랜덤 생성)
+    agent_session_id = agent_session_for(request.user_id)
 
-    # 세션 ID는 랜덤 생성 (또는 사용자별 유지 가능)
-    agent_session_id = str(uuid.uuid4())
+    messages = call_agent(agent_session_id, user_input)
+    
+    if not messages:
+        raise Exception("No response from Agent")
+        
+    # Agent 응답 중 텍스트 메시지 찾기
+    agent_text = ""
+    for msg in messages:
+        if msg.text:
+            agent_text += "".join(msg.text.text)
+    
+    print(f"🤖 Agent Raw Response: {agent_text}")
 
+    # JSON 파싱 시도
     try:
-        messages = call_agent(agent_session_id, user_input)
+        # Markdown 코드 블록 제거 (```json ... ```)
+        clean_text = agent_text.replace("```json", "").replace("```", "").strip()
+        result = orjson.loads(clean_text)
         
-        if not messages:
-            raise Exception("No response from Agent")
+        # 탐정 모드일 경우 시각화 문제 덮어쓰기
+        if is_detective:
+            result['problem'] = visual_problem
+            result['is_detective'] = True
             
-        # Agent 응답 중 텍스트 메시지 찾기
-        agent_text = ""
-        for msg in messages:
-            if msg.text:
-                agent_text += "".join(msg.text.text)
-        
-        print(f"🤖 Agent Raw Response: {agent_text}")
+    except orjson.JSONDecodeError:
+        print("⚠️ Agent response is not valid JSON. Using raw text as message.")
+        result = {
+            "message": agent_text,
+            "visual_items": [],
+            "animation_type": "counting",
+            "correct_answer": 0,
+            "problem": visual_problem if is_detective else request.problem
+        }
 
-        # JSON 파싱 시도
-        try:
-            # Markdown 코드 블록 제거 (```json ... ```)
-            clean_text = agent_text.replace("```json", "").replace("```", "").strip()
-            result = json.loads(clean_text)
-            
-            # 탐정 모드일 경우 시각화 문제 덮어쓰기
-            if is_detective:
-                result['problem'] = visual_problem
-                result['is_detective'] = True
-                
-        except json.JSONDecodeError:
-            print("⚠️ Agent response is not valid JSON. Using raw text as message.")
-            result = {
-                "message": agent_text,
-                "visual_items": [],
-                "animation_type": "counting",
-                "correct_answer": 0,
-                "problem": visual_problem if is_detective else request.problem
-            }
+    if operands:
+        result['visual_operands'] = operands
+
+    return result
+
+def fallback_explanation(request: QuizRequest, error: Exception) -> dict:
+    """Agent 실패 시 기본 설명 (오디오 제외)"""
+    error_msg = f"🔥 에러: {str(error)}"
+    print(error_msg)
+    with open("backend_error.log", "a", encoding="utf-8") as f:
+        f.write(f"{error_msg}\n")
         
+    fallback_msg = FALLBACK_TEMPLATE.format(user_name=request.user_name)
+    
+    return {
+        "message": fallback_msg,
+        "animation_type": "counting",
+        "visual_items": ["star"] * 5, 
+        "correct_answer": 0
+    }
+
+async def build_explanation(request: QuizRequest) -> dict:
+    """Agent 설명 + TTS (실패 시 기본 설명)"""
+    try:
+        result = await asyncio.to_thread(request_explanation, request)
+    except Exception as e:
+        # Fallback response (이름만 바뀌는 문장이라 음성 조각으로 조립)
+        result = fallback_explanation(request, e)
+        result['audio_base64'] = await asyncio.to_thread(render_template_audio, FALLBACK_TEMPLATE, user_name=request.user_name)
+    else:
         # TTS Generation
-        audio_base64 = synthesize_text(result.get('message', ''))
-        result['audio_base64'] = audio_base64
-        
-        print(f"📤 [응답] AI 선생님: {result.get('message')}")
-        return result
+        result['audio_base64'] = await asyncio.to_thread(synthesize_text, result.get('message', ''))
+    
+    print(f"📤 [응답] AI 선생님: {result.get('message')}")
+    return result
+
+@app.post("/explain-error")
+async def explain_error(request: QuizRequest):
+    if not session_client:
+        raise HTTPException(status_code=500, detail="Agent client not initialized")
+
+    print(f"📥 [오답 설명 요청] {request.user_name}: {request.problem} (답: {request.wrong_answer})")
+    
+    # Log to Firestore
+    log_explanation_request(request)
 
+    return ORJSONResponse(await build_explanation(request))
+
+def try_record_submission(request: SubmitResultRequest, answer: int, is_correct: bool,
+                          claims: Optional[ProblemClaims] = None) -> Optional[dict]:
+    """record_submission (DB 가 없거나 실패하면 None, 설명 응답을 막지 않도록)"""
+    if not db:
+        return None
+    try:
+        return record_submission(request, answer, is_correct, claims)
     except Exception as e:
-        error_msg = f"🔥 에러: {str(e)}"
-        print(error_msg)
-        with open("backend_error.log", "a", encoding="utf-8") as f:
-            f.write(f"{error_msg}\n")
-            
-        # Fallback response
-        fallback_msg = f"{request.user_name}, 괜찮아! 우리 다시 한 번 천천히 세어볼까?"
-        
-        return {
-            "message": fallback_msg,
-            "animation_type": "counting",
-            "visual_items": ["star"] * 5, 
-            "correct_answer": 0,
-            "audio_base64": synthesize_text(fallback_msg)
+        print(f"🔥 Submit answer bookkeeping failed: {e}")
+        return None
+
+@app.post("/submit-answer")
+async def submit_answer(request: SubmitAnswerRequest):
+    """결과 제출 + (오답이면) 설명까지 한 번에 처리
+
+    진행 상황 트랜잭션/히스토리 기록과 Agent 설명/TTS 는 서로 독립이라 동시에 실행합니다.
+    기록이 실패하거나 DB 가 없어도 설명은 그대로 돌려주고 진행 상황 필드만 null 로 둡니다.
+    """
+    claims = verify_submission(request)
+    answer, is_correct = grade_submission(request, claims)
+    
+    # 재시도는 이전에 합친 응답을 그대로 반환
+    cache_key = (request.session_id, request.problem_id, "answer")
+    with submit_cache_lock:
+        cached_response = submit_response_cache.get(cache_key)
+    if cached_response is not None:
+        print(f"♻️ [중복 제출] session: {request.session_id}, problem: {request.problem_id}")
+        return ORJSONResponse(cached_response)
+    
+    quiz_request = QuizRequest(
+        problem=request.problem,
+        wrong_answer="시간초과" if request.user_answer == "TIMEOUT" else request.user_answer,
+        user_name=request.user_name,
+        user_id=request.user_id
+    )
+    
+    try:
+        async with asyncio.TaskGroup() as tg:
+            result_task = tg.create_task(asyncio.to_thread(try_record_submission, request, answer, is_correct, claims))
+            if is_correct:
+                audio_task = tg.create_task(asyncio.to_thread(praise_audio, answer))
+            elif session_client:
+                print(f"📥 [오답 설명 요청] {request.user_name}: {request.problem} (답: {request.user_answer})")
+                tg.create_task(asyncio.to_thread(log_explanation_request, quiz_request))
+                explanation_task = tg.create_task(build_explanation(quiz_request))
+    except* Exception as eg:
+        error = eg.exceptions[0]
+        print(f"🔥 Submit answer failed: {error}")
+        raise HTTPException(status_code=500, detail=str(error))
+    
+    response = result_task.result()
+    recorded = response is not None
+    if not recorded:
+        response = {
+            "new_level": None,
+            "level_stickers": None,
+            "total_stickers": None,
+            "levelup_event": False,
+            "is_correct": is_correct
         }
+    response["answer"] = answer
+    response["audio_base64"] = audio_task.result() if is_correct else None
+    response["explanation"] = explanation_task.result() if not is_correct and session_client else None
+    
+    # 기록에 실패한 응답은 캐시하지 않음 (다음 재전송에서 다시 기록 시도)
+    if recorded:
+        with submit_cache_lock:
+            submit_response_cache[cache_key] = response
+    
+    return ORJSONResponse(response)
+
+@app.post("/explain-error/stream")
+async def explain_error_stream(request: QuizRequest):
+    """오답 설명 스트리밍 (SSE)
+
+    설명 텍스트/시각화 정보를 먼저 보내고, 메시지를 문장 단위로 나눠
+    동시에 TTS 합성한 뒤 순서대로 audio 이벤트로 보냅니다.
+    events: explanation -> audio (index 순서) ... -> done
+    """
+    if not session_client:
+        raise HTTPException(status_code=500, detail="Agent client not initialized")
+
+    print(f"📥 [오답 설명 스트림 요청] {request.user_name}: {request.problem} (답: {request.wrong_answer})")
+    
+    log_explanation_request(request)
+
+    async def event_stream():
+        fallback = False
+        try:
+            result = await asyncio.to_thread(request_explanation, request)
+        except Exception as e:
+            result = fallback_explanation(request, e)
+            fallback = True
+
+        yield sse_event("explanation", result)
+        print(f"📤 [스트림 응답] AI 선생님: {result.get('message')}")
+
+        if fallback:
+            # 기본 설명은 음성 조각으로 한 번에 조립
+            sentences = [result['message']]
+            tasks = [asyncio.create_task(asyncio.to_thread(render_template_audio, FALLBACK_TEMPLATE, user_name=request.user_name))]
+        else:
+            # 문장별 TTS 를 한꺼번에 시작하고, 끝나는 대로 순서를 지켜 전송
+            sentences = split_sentences(result.get('message', ''))
+            tasks = [asyncio.create_task(asyncio.to_thread(synthesize_text, sentence)) for sentence in sentences]
+        try:
+            for index, (sentence, task) in enumerate(zip(sentences, tasks)):
+                audio_base64 = await task
+                yield sse_event("audio", {"index": index, "text": sentence, "audio_base64": audio_base64})
+        finally:
+            # 클라이언트 연결이 끊기면 남은 작업은 결과를 버립니다
+            for task in tasks:
+                task.cancel()
+
+        yield sse_event("done", {"count": len(sentences)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+HEALTH_RESPONSE = PrecomputedJSON({"status": "Math AI Server is Running 🚀"})
+# 타임아웃 안내는 항상 같은 문장이므로 TTS 성공 후 직렬화/압축 결과를 재사용
+timeout_audio_response: Optional[PrecomputedJSON] = None
 
 @app.get("/")
 async def health_check():
-    return {"status": "Math AI Server is Running 🚀"}
+    return HEALTH_RESPONSE.response()
 
 @app.get("/timeout-audio")
-async def get_timeout_audio():
-    text = "시간이 다 됐어요! 선생님이랑 같이 풀어볼까요?"
-    audio_base64 = synthesize_text(text)
-    return {"audio_base64": audio_base64, "message": text}
+async def get_timeout_audio(accept_encoding: Optional[str] = Header(default=None)):
+    global timeout_audio_response
+    if timeout_audio_response is None:
+        audio_base64 = synthesize_phrase(TIMEOUT_MESSAGE)
+        payload = {"audio_base64": audio_base64, "message": TIMEOUT_MESSAGE}
+        if not audio_base64:
+            # TTS 실패는 캐시하지 않고 다음 요청에서 다시 시도
+            return ORJSONResponse(payload)
+        timeout_audio_response = PrecomputedJSON(payload)
+    return timeout_audio_response.response(accept_encoding)
+
+def require_task_token(x_task_token: Optional[str]):
+    """운영용 엔드포인트 보호 (TASK_TOKEN 이 없으면 항상 거부)"""
+    task_token = os.getenv("TASK_TOKEN")
+    if not task_token or x_task_token != task_token:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.post("/tasks/compact")
+async def compact_sessions(x_task_token: Optional[str] = Header(default=None)):
+    """세션/히스토리 압축 작업 (Cloud Scheduler 호출용)"""
+    require_task_token(x_task_token)
+    if not db:
+        raise HTTPException(status_code=500, detail="Database not connected")
+
+    return await asyncio.to_thread(run_compaction, db)
+
+def warm_up_fragments():
+    load_fragment_bundle()
+    if FRAGMENT_PREWARM and tts_client:
+        prewarm_fragments()
+
+@app.get("/debug-channels")
+async def debug_channels():
+    """gRPC 채널 / Agent 세션 / 음성 조각 재사용 통계"""
+    with agent_session_lock:
+        agent_stats = dict(agent_session_stats, active=len(agent_sessions))
+    return {"channels": channel_pool.stats(), "agent_sessions": agent_stats, "audio_fragments": fragment_library.stats()}
+
+@app.get("/debug-profiles")
+async def debug_profiles(x_task_token: Optional[str] = Header(default=None)):
+    """저장된 요청 프로파일 목록 (speedscope 형식)"""
+    require_task_token(x_task_token)
+    return {"profiles": list_profiles()}
+
+@app.get("/debug-profiles/{name}")
+async def download_profile(name: str, x_task_token: Optional[str] = Header(default=None)):
+    """프로파일 파일 다운로드 (https://www.speedscope.app 에서 열기)"""
+    require_task_token(x_task_token)
+    path = profile_path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=name)
 
 @app.get("/debug-db")
 async def debug_db():
@@ -611,25 +1243,77 @@ def normalize_korean_number(text: str) -> str:
         normalized = normalized.replace(korean, digit)
     
     # 숫자만 추출
-    import re
     return re.sub(r'[^0-9]', '', normalized)
 
+# 업로드 음성 최대 크기 (숫자 하나 말하는 데 충분한 크기, multipart 헤더 포함)
+MAX_STT_UPLOAD_BYTES = int(os.getenv("MAX_STT_UPLOAD_BYTES", str(1024 * 1024)))
+
+def limit_request_body(request: Request, limit: int) -> Request:
+    """본문을 받는 도중 크기 제한을 넘으면 바로 중단하는 Request"""
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > limit:
+                raise HTTPException(status_code=413, detail="Audio upload too large")
+        return message
+
+    return Request(request.scope, receive)
+
 @app.post("/stt")
-async def speech_to_text(file: UploadFile = File(...)):
+async def speech_to_text(request: Request):
     if not speech_client:
         raise HTTPException(status_code=500, detail="Speech client not initialized")
     
+    # Content-Length 로 먼저 거르고, 본문 스트림도 받는 동안 크기를 제한
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_STT_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Audio upload too large")
+    form = await limit_request_body(request, MAX_STT_UPLOAD_BYTES).form(max_files=1)
+    file = form.get("file")
+    if not isinstance(file, UploadFile):
+        raise HTTPException(status_code=422, detail="Missing audio file")
+    
     try:
         content = await file.read()
-        audio = speech.RecognitionAudio(content=content)
+    finally:
+        # 업로드 임시 파일 정리
+        await form.close()
+    
+    try:
+        # 16kHz PCM 으로 디코딩 + 앞뒤 무음 제거 (디코딩에 실패하면 원본 그대로)
+        pcm = None
+        try:
+            pcm = await asyncio.to_thread(preprocess_for_recognition, content)
+        except Exception as e:
+            print(f"⚠️ Audio preprocessing failed, sending original: {e}")
         
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
-            sample_rate_hertz=48000,
-            language_code="ko-KR",
-            enable_automatic_punctuation=True,
-        )
+        if pcm is not None:
+            if not pcm:
+                # 말소리가 없으면 인식 요청 자체를 생략
+                print("🎤 STT: no speech detected")
+                return {"text": "", "number": ""}
+            print(f"🎚️ STT Audio: {len(content)} bytes -> {len(pcm)} bytes PCM ({len(pcm) / 2 / TARGET_SAMPLE_RATE:.2f}s)")
+            audio = speech.RecognitionAudio(content=pcm)
+            config = speech.RecognitionConfig(
+                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+                sample_rate_hertz=TARGET_SAMPLE_RATE,
+                language_code="ko-KR",
+                enable_automatic_punctuation=True,
+            )
+        else:
+            audio = speech.RecognitionAudio(content=content)
+            config = speech.RecognitionConfig(
+                encoding=speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
+                sample_rate_hertz=48000,
+                language_code="ko-KR",
+                enable_automatic_punctuation=True,
+            )
         
+        channel_pool.record_call("speech")
         response = speech_client.recognize(config=config, audio=audio)
         
         transcript = ""
@@ -644,6 +1328,8 @@ async def speech_to_text(file: UploadFile = File(...)):
         print(f"🔢 Converted Number: {number}")
         
         return {"text": transcript, "number": number}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"STT Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,86 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+import orjson
+from typing import NamedTuple, Optional
+
+# 문제 토큰 (HMAC 서명)
+#
+# generate-problem 이 문제/정답/레벨/세션/발급 시각/토큰 ID 를 서명해 내려주면,
+# submit-result 는 세션 문서를 읽지 않고도 채점과 레벨 확인을 할 수 있습니다.
+# 형식: base64url(payload JSON) + "." + base64url(HMAC-SHA256 앞 16바이트)
+# PROBLEM_TOKEN_SECRET 이 없으면 토큰을 발급하지 않습니다 (인스턴스 간 검증 불가).
+# 토큰을 쓰는 동안 토큰 없는 제출은 거부하며, 배포 전환 중에만
+# ALLOW_UNSIGNED_SUBMISSIONS=1 로 예전 방식 제출을 허용할 수 있습니다.
+
+PROBLEM_TOKEN_SECRET = os.getenv("PROBLEM_TOKEN_SECRET", "")
+PROBLEM_TOKEN_TTL_SECONDS = int(os.getenv("PROBLEM_TOKEN_TTL_SECONDS", "86400"))
+ALLOW_UNSIGNED_SUBMISSIONS = os.getenv("ALLOW_UNSIGNED_SUBMISSIONS", "0") == "1"
+SIGNATURE_BYTES = 16
+
+
+class ProblemTokenError(ValueError):
+    """토큰 서명/형식/만료 오류"""
+
+
+class ProblemClaims(NamedTuple):
+    token_id: str
+    session_id: str
+    problem: str
+    answer: int
+    level: int
+    issued_at: int
+
+
+def tokens_enabled() -> bool:
+    return bool(PROBLEM_TOKEN_SECRET)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: bytes, secret: str) -> bytes:
+    return hmac.new(secret.encode("utf-8"), payload, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+
+def issue_token(claims: ProblemClaims, secret: str = PROBLEM_TOKEN_SECRET) -> str:
+    payload = orjson.dumps({
+        "i": claims.token_id,
+        "s": claims.session_id,
+        "p": claims.problem,
+        "a": claims.answer,
+        "l": claims.level,
+        "t": claims.issued_at,
+    })
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload, secret))}"
+
+
+def verify_token(token: str, secret: str = PROBLEM_TOKEN_SECRET, now: Optional[float] = None,
+                 ttl: int = PROBLEM_TOKEN_TTL_SECONDS) -> ProblemClaims:
+    """서명과 만료를 확인한 토큰 내용 (잘못된 토큰이면 ProblemTokenError)"""
+    try:
+        encoded_payload, encoded_signature = token.split(".")
+        payload = _b64decode(encoded_payload)
+        signature = _b64decode(encoded_signature)
+    except ValueError:
+        raise ProblemTokenError("Malformed problem token")
+
+    if not hmac.compare_digest(signature, _sign(payload, secret)):
+        raise ProblemTokenError("Invalid problem token signature")
+
+    try:
+        data = orjson.loads(payload)
+        claims = ProblemClaims(data["i"], data["s"], data["p"], int(data["a"]), int(data["l"]), int(data["t"]))
+    except (orjson.JSONDecodeError, KeyError, TypeError, ValueError):
+        raise ProblemTokenError("Malformed problem token payload")
+
+    if (time.time() if now is None else now) - claims.issued_at > ttl:
+        raise ProblemTokenError("Problem token expired")
+    return claims
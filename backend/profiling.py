@@ -0,0 +1,98 @@
+import os
+import re
+import time
+import random
+from typing import Optional
+from pyinstrument import Profiler
+from pyinstrument.renderers import SpeedscopeRenderer
+
+# 요청 단위 프로파일링 (선택 기능)
+#
+# PROFILE_SAMPLE_RATE (0~1) 비율의 요청, 또는 X-Profile 헤더 값이
+# PROFILE_TOKEN 과 같은 요청만 샘플링 프로파일러(pyinstrument)로 감싸고,
+# 결과를 speedscope 형식 파일로 PROFILE_DIR 에 남깁니다 (최대 PROFILE_MAX_FILES 개).
+# 두 설정이 모두 없으면 미들웨어 자체를 등록하지 않으므로 오버헤드가 없습니다.
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+
+PROFILE_SUFFIX = ".speedscope.json"
+PROFILE_NAME_PATTERN = re.compile(r"^[\w.-]+\.speedscope\.json$")
+
+
+def profiling_enabled() -> bool:
+    return PROFILE_SAMPLE_RATE > 0 or bool(PROFILE_TOKEN)
+
+
+class ProfilingMiddleware:
+    """샘플링/헤더로 선택된 요청만 프로파일링하는 ASGI 미들웨어"""
+
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE, token: Optional[str] = PROFILE_TOKEN,
+                 output_dir: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.token = token.encode("utf-8") if token else None
+        self.output_dir = output_dir
+        self.max_files = max_files
+        os.makedirs(output_dir, exist_ok=True)
+
+    def should_profile(self, scope) -> bool:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == b"x-profile" and value == self.token:
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            try:
+                self.write_profile(profiler, scope, elapsed_ms)
+            except Exception as e:
+                print(f"⚠️ Profile write failed: {e}")
+
+    def write_profile(self, profiler, scope, elapsed_ms: float):
+        slug = re.sub(r"[^\w-]+", "_", scope["path"].strip("/")) or "root"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{scope['method']}-{slug}-{elapsed_ms:.0f}ms{PROFILE_SUFFIX}"
+        with open(os.path.join(self.output_dir, name), "w", encoding="utf-8") as f:
+            f.write(profiler.output(renderer=SpeedscopeRenderer()))
+        print(f"🔬 [Profile] {scope['method']} {scope['path']} {elapsed_ms:.0f}ms -> {name}")
+        self.prune()
+
+    def prune(self):
+        """오래된 프로파일부터 지워 최대 개수 유지"""
+        profiles = sorted(list_profiles(self.output_dir), key=lambda p: p["modified"])
+        for profile in profiles[:max(len(profiles) - self.max_files, 0)]:
+            os.remove(os.path.join(self.output_dir, profile["name"]))
+
+
+def list_profiles(output_dir: str = PROFILE_DIR) -> list:
+    if not os.path.isdir(output_dir):
+        return []
+    profiles = []
+    for entry in os.scandir(output_dir):
+        if entry.is_file() and PROFILE_NAME_PATTERN.match(entry.name):
+            stat = entry.stat()
+            profiles.append({"name": entry.name, "size": stat.st_size, "modified": stat.st_mtime})
+    return sorted(profiles, key=lambda p: p["modified"], reverse=True)
+
+
+def profile_path(name: str, output_dir: str = PROFILE_DIR) -> Optional[str]:
+    """다운로드할 프로파일 파일 경로 (이름이 올바르지 않거나 없으면 None)"""
+    if not PROFILE_NAME_PATTERN.match(name):
+        return None
+    path = os.path.join(output_dir, name)
+    return path if os.path.isfile(path) else None
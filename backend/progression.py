@@ -0,0 +1,57 @@
+from typing import NamedTuple
+import numpy as np
+
+# 스티커/레벨 진행 규칙
+#
+# 정답마다 스티커 1개, 레벨 스티커 10개가 모이면 다음 레벨 (최대 5레벨).
+# 최고 레벨에서는 레벨 스티커가 초기화되지 않고 계속 쌓입니다.
+# apply_result 는 submit-result 에서 쓰는 단일 학생용 함수이고,
+# apply_results 는 같은 규칙을 NumPy 배열(여러 학생)에 한 번에 적용합니다.
+# settle_level 은 스티커를 Increment 로 먼저 올린 뒤(토큰 제출) 레벨업을 정산하는 규칙으로,
+# 레벨 스티커가 이미 10개를 넘겨 있어도(이전 레벨업 쓰기 실패) 다시 레벨업합니다.
+
+STICKERS_PER_LEVEL = 10
+MAX_LEVEL = 5
+
+
+class Progress(NamedTuple):
+    level: int
+    level_stickers: int
+    total_stickers: int
+    levelup_event: bool = False
+
+
+def apply_result(level: int, level_stickers: int, total_stickers: int, is_correct: bool) -> Progress:
+    """문제 하나의 결과를 반영한 진행 상태"""
+    if not is_correct:
+        return Progress(level, level_stickers, total_stickers)
+
+    level_stickers += 1
+    total_stickers += 1
+
+    # 10개 모으면 레벨업
+    if level_stickers >= STICKERS_PER_LEVEL and level < MAX_LEVEL:
+        return Progress(level + 1, 0, total_stickers, True)
+    return Progress(level, level_stickers, total_stickers)
+
+
+def settle_level(level: int, level_stickers: int, total_stickers: int) -> Progress:
+    """스티커가 이미 반영된 상태의 레벨업 정산 (10개 이상이면 레벨업하고 10개 차감)"""
+    if level_stickers >= STICKERS_PER_LEVEL and level < MAX_LEVEL:
+        return Progress(level + 1, level_stickers - STICKERS_PER_LEVEL, total_stickers, True)
+    return Progress(level, level_stickers, total_stickers)
+
+
+def apply_results(level: np.ndarray, level_stickers: np.ndarray, total_stickers: np.ndarray, is_correct: np.ndarray):
+    """apply_result 의 벡터화 버전 (입력 배열은 수정하지 않음)
+
+    returns: (level, level_stickers, total_stickers, levelup_event)
+    """
+    correct = is_correct.astype(level_stickers.dtype)
+    level_stickers = level_stickers + correct
+    total_stickers = total_stickers + correct
+
+    levelup_event = is_correct & (level_stickers >= STICKERS_PER_LEVEL) & (level < MAX_LEVEL)
+    level = np.where(levelup_event, level + 1, level)
+    level_stickers = np.where(levelup_event, 0, level_stickers)
+    return level, level_stickers, total_stickers, levelup_event
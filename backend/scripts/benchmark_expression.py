@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from expression import parse_problem, solve_problem, visual_operands
+
+# 문제 식 파싱+계산 처리량 벤치마크 (캐시 없음 / 캐시 적중)
+# 실행: python scripts/benchmark_expression.py
+
+ITERATIONS = 200000
+
+
+def sample_problems(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    problems = []
+    for _ in range(count):
+        a, b, c = rng.randint(1, 20), rng.randint(1, 9), rng.randint(1, 9)
+        form = rng.randrange(4)
+        if form == 0:
+            problems.append(f"{a} + {b}")
+        elif form == 1:
+            problems.append(f"{a + b} - {b}")
+        elif form == 2:
+            problems.append(f"{a} + ? = {a + b}")
+        else:
+            problems.append(f"{a} - {b} + {c}")
+    return problems
+
+
+def run_pass(problems) -> float:
+    start = time.perf_counter()
+    for text in problems:
+        solve_problem(text)
+        visual_operands(text)
+    return time.perf_counter() - start
+
+
+def run():
+    # 캐시 없음: 매 호출마다 캐시를 비워 순수 파싱 비용 측정
+    cold_problems = sample_problems(ITERATIONS // 10)
+    start = time.perf_counter()
+    for text in cold_problems:
+        parse_problem.cache_clear()
+        solve_problem(parse_problem(text))
+    cold = time.perf_counter() - start
+    print(f"🧊 cold parse+eval : {len(cold_problems) / cold:>12,.0f} ops/s")
+
+    # 캐시 적중: 문제 은행 크기(150개)의 문자열을 반복 사용
+    parse_problem.cache_clear()
+    bank = sample_problems(150)
+    warm_problems = [bank[i % len(bank)] for i in range(ITERATIONS)]
+    warm = run_pass(warm_problems)
+    print(f"🔥 warm solve+visual: {len(warm_problems) / warm:>12,.0f} ops/s")
+    print(f"📦 cache: {parse_problem.cache_info()}")
+
+
+if __name__ == "__main__":
+    run()
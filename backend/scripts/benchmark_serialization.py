@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import base64
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from starlette.responses import JSONResponse
+from serialization import compress
+
+# 응답 직렬화 벤치마크: 라우트별 직렬화 CPU 시간과 전송 바이트 비교
+# 실행: python scripts/benchmark_serialization.py
+
+ITERATIONS = 2000
+
+
+def fake_audio_base64(seconds: float) -> str:
+    # MP3 (32kbps 근사) 는 이미 압축된 데이터라 난수로 흉내냅니다.
+    return base64.b64encode(os.urandom(int(seconds * 4000))).decode("utf-8")
+
+
+ROUTE_PAYLOADS = {
+    "/generate-problem": {
+        "problem": "12 + 5", "answer": 17, "level": 4, "id": "7b0c6f1e-8a3e-4c55-9e1f-0b8d5e2f9a11",
+        "stickers": 3, "total_stickers": 33, "source": "problem_bank",
+    },
+    "/submit-result": {
+        "new_level": 2, "level_stickers": 4, "total_stickers": 14, "levelup_event": False,
+        "audio_base64": fake_audio_base64(2.0),
+    },
+    "/explain-error": {
+        "message": "민준아, 괜찮아! 8에서 3을 빼면 5가 돼. 손가락으로 같이 세어볼까? 하나, 둘, 셋을 접으면 다섯 개가 남지?",
+        "visual_items": ["apple"] * 8, "animation_type": "counting", "correct_answer": 5, "problem": "8 - 3",
+        "audio_base64": fake_audio_base64(9.0),
+    },
+    "/timeout-audio": {
+        "audio_base64": fake_audio_base64(4.0), "message": "시간이 다 됐어요! 선생님이랑 같이 풀어볼까요?",
+    },
+}
+
+
+def time_per_call(fn, iterations: int = ITERATIONS) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def stdlib_serialize(payload) -> bytes:
+    # 기존 경로: jsonable_encoder + 표준 json (JSONResponse)
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def orjson_serialize(payload) -> bytes:
+    return ORJSONResponse(payload).body
+
+
+def run():
+    header = f"{'route':<20}{'stdlib µs':>12}{'orjson µs':>12}{'raw B':>10}{'gzip B':>10}{'br B':>10}"
+    print(header)
+    print("-" * len(header))
+
+    for route, payload in ROUTE_PAYLOADS.items():
+        stdlib_us = time_per_call(lambda: stdlib_serialize(payload))
+        orjson_us = time_per_call(lambda: orjson_serialize(payload))
+
+        body = orjson_serialize(payload)
+        gzip_size = len(compress(body, "gzip"))
+        br_size = len(compress(body, "br"))
+        print(f"{route:<20}{stdlib_us:>12.1f}{orjson_us:>12.1f}{len(body):>10}{gzip_size:>10}{br_size:>10}")
+
+
+if __name__ == "__main__":
+    run()
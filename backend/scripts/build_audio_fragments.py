@@ -0,0 +1,43 @@
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main
+from audio_fragments import dump_bundle, load_bundle, read_bundle, write_bundle
+
+# 음성 조각 번들 생성: 고정 문구 + 숫자 0~100 을 한 번만 합성해 저장
+# 서버는 시작할 때 FRAGMENT_BUNDLE_URI 에서 읽기만 합니다 (기본: backend/assets/audio_fragments.bin)
+#
+# 실행: python scripts/build_audio_fragments.py                        (기본 경로에 저장, 기존 번들 조각은 재사용)
+#       python scripts/build_audio_fragments.py --output gs://bucket/audio_fragments.bin
+#       python scripts/build_audio_fragments.py --rebuild               (전부 다시 합성)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default=main.FRAGMENT_BUNDLE_URI)
+    parser.add_argument("--rebuild", action="store_true", help="기존 번들을 무시하고 전부 다시 합성")
+    args = parser.parse_args()
+
+    if not main.tts_client:
+        sys.exit("❌ TTS client is not available")
+
+    if not args.rebuild:
+        existing = read_bundle(args.output)
+        if existing:
+            try:
+                main.fragment_library.load(load_bundle(existing, main.TTS_VOICE_KEY))
+            except ValueError as e:
+                print(f"⚠️ Ignoring existing bundle: {e}")
+
+    texts = main.fragment_texts()
+    main.prewarm_fragments(texts)
+    fragments = main.fragment_library.snapshot()
+    missing = [text for text in texts if text not in fragments]
+    if missing:
+        sys.exit(f"❌ Failed to synthesize {len(missing)} fragments: {missing}")
+
+    data = dump_bundle({text: fragments[text] for text in texts}, main.TTS_VOICE_KEY)
+    write_bundle(args.output, data)
+    print(f"✅ {len(texts)} fragments ({len(data):,} bytes) -> {args.output}")
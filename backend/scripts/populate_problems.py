@@ -1,9 +1,27 @@
 import os
+import sys
 import time
+import random
 import firebase_admin
 from firebase_admin import credentials, firestore
 from google.cloud import firestore as google_firestore
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from expression import solve_problem, skill_tags
+
+# 문제 문서마다 rand (무작위 정렬 키) 와 skills (기술 태그) 를 저장합니다.
+# main.sample_problems 가 쓰는 복합 색인은 firestore.indexes.json (저장소 루트) 참고:
+#   gcloud firestore indexes composite create --database=math-ai --collection-group=problems \
+#     --field-config=field-path=level,order=ascending --field-config=field-path=rand,order=ascending
+#   gcloud firestore indexes composite create --database=math-ai --collection-group=problems \
+#     --field-config=field-path=level,order=ascending --field-config=field-path=skills,array-config=contains \
+#     --field-config=field-path=rand,order=ascending
+#
+# 실행: python scripts/populate_problems.py              (문제 은행 새로 채우기)
+#       python scripts/populate_problems.py --backfill   (기존 문서에 rand/skills 만 채우기)
+
+BATCH_LIMIT = 450
+
 # Configuration
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT", "math-ai-479306")
 KEY_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
@@ -87,22 +105,68 @@ HARDCODED_PROBLEMS = {
     ]
 }
 
+def problem_keys(problem: str) -> dict:
+    """샘플링용 필드 (rand, skills)"""
+    return {"rand": random.random(), "skills": skill_tags(problem)}
+
+def clear_problems():
+    deleted = 0
+    while True:
+        docs = list(db.collection("problems").limit(BATCH_LIMIT).stream())
+        if not docs:
+            break
+        batch = db.batch()
+        for doc in docs:
+            batch.delete(doc.reference)
+        batch.commit()
+        deleted += len(docs)
+    print(f"🧹 Deleted {deleted} existing problems")
+
+def backfill():
+    """rand 가 없는 기존 문제 문서에 rand/skills 를 일괄로 채움"""
+    updated = 0
+    batch = db.batch()
+    pending = 0
+    for doc in db.collection("problems").select(["problem", "rand"]).stream():
+        data = doc.to_dict()
+        if "rand" in data:
+            continue
+        try:
+            keys = problem_keys(data["problem"])
+        except (KeyError, ValueError) as e:
+            print(f"⚠️ Skipping {doc.id}: {e}")
+            continue
+        batch.update(doc.reference, keys)
+        pending += 1
+        updated += 1
+        if pending >= BATCH_LIMIT:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+    print(f"✨ Backfilled rand/skills on {updated} problems")
+
 def populate():
     print("🧹 Clearing existing problems...")
-    docs = db.collection("problems").limit(500).stream()
-    for doc in docs:
-        doc.reference.delete()
+    clear_problems()
         
     total_added = 0
     
     for level, problems in HARDCODED_PROBLEMS.items():
         batch = db.batch()
         for p in problems:
+            # 정답은 문제 식에서 계산 (손으로 적은 값과 다르면 경고)
+            answer = solve_problem(p["problem"])
+            if answer != p["answer"]:
+                print(f"⚠️ Answer mismatch for '{p['problem']}': {p['answer']} -> {answer}")
+            
             doc_ref = db.collection("problems").document()
             batch.set(doc_ref, {
                 "level": level,
                 "problem": p["problem"],
-                "answer": p["answer"],
+                "answer": answer,
+                **problem_keys(p["problem"]),
                 "created_at": firestore.SERVER_TIMESTAMP
             })
             total_added += 1
@@ -114,4 +178,7 @@ def populate():
     print(f"✨ Successfully populated {total_added} problems!")
 
 if __name__ == "__main__":
-    populate()
+    if "--backfill" in sys.argv:
+        backfill()
+    else:
+        populate()
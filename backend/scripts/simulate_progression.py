@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from progression import apply_result, apply_results, settle_level, MAX_LEVEL, STICKERS_PER_LEVEL
+
+# 학습자 진행 시뮬레이터: 레벨업 규칙(스티커 10개)과 프론트엔드 목표값
+# (GIFT_THRESHOLD=25, TOTAL_GOAL=30) 튜닝용
+#
+# 실행: python scripts/simulate_progression.py --learners 1000000
+#       python scripts/simulate_progression.py --check   (벡터화 함수/토큰 제출 정산과 apply_result 일치 검사)
+
+# frontend/src/lib/types.ts 와 같은 값
+GIFT_THRESHOLD = 25
+TOTAL_GOAL = 30
+
+# 레벨별 평균 정답률 (학습자마다 Beta 분포에서 뽑음)
+DEFAULT_ACCURACY = (0.9, 0.8, 0.8, 0.75, 0.7)
+DEFAULT_CONCENTRATION = 10.0
+
+
+def simulate(n_learners: int, accuracy=DEFAULT_ACCURACY, concentration: float = DEFAULT_CONCENTRATION,
+             max_problems: int = 300, gift_threshold: int = GIFT_THRESHOLD, total_goal: int = TOTAL_GOAL,
+             seed: int = 0) -> dict:
+    """학습자 n 명을 동시에 진행시키고 각 이벤트에 도달한 문제 번호를 기록 (-1 은 미도달)"""
+    rng = np.random.default_rng(seed)
+    means = np.asarray(accuracy, dtype=np.float64)
+    learner_accuracy = rng.beta(
+        means * concentration, (1 - means) * concentration, size=(n_learners, MAX_LEVEL)
+    ).astype(np.float32)
+
+    rows = np.arange(n_learners)
+    level = np.ones(n_learners, dtype=np.int8)
+    level_stickers = np.zeros(n_learners, dtype=np.int16)
+    total_stickers = np.zeros(n_learners, dtype=np.int32)
+
+    reached_level = np.full((n_learners, MAX_LEVEL + 1), -1, dtype=np.int32)
+    reached_level[:, 1] = 0
+    gift_at = np.full(n_learners, -1, dtype=np.int32)
+    goal_at = np.full(n_learners, -1, dtype=np.int32)
+
+    for step in range(1, max_problems + 1):
+        correct = rng.random(n_learners, dtype=np.float32) < learner_accuracy[rows, level - 1]
+        level, level_stickers, total_stickers, levelup = apply_results(level, level_stickers, total_stickers, correct)
+
+        if levelup.any():
+            reached_level[levelup, level[levelup]] = step
+        gift_at[(gift_at < 0) & (total_stickers >= gift_threshold)] = step
+        goal_at[(goal_at < 0) & (total_stickers >= total_goal)] = step
+
+        if (goal_at >= 0).all() and (level == MAX_LEVEL).all():
+            break
+
+    return {"reached_level": reached_level, "gift_at": gift_at, "goal_at": goal_at}
+
+
+def summarize(label: str, steps: np.ndarray) -> str:
+    reached = steps[steps >= 0]
+    if len(reached) == 0:
+        return f"{label:<12}{0:>9.1%}{'-':>8}{'-':>8}{'-':>8}"
+    p50, p90, p99 = np.percentile(reached, [50, 90, 99])
+    return f"{label:<12}{len(reached) / len(steps):>9.1%}{p50:>8.0f}{p90:>8.0f}{p99:>8.0f}"
+
+
+def report(result: dict):
+    print(f"{'event':<12}{'reached':>9}{'p50':>8}{'p90':>8}{'p99':>8}   (문제 수)")
+    for level in range(2, MAX_LEVEL + 1):
+        print(summarize(f"Lv.{level}", result["reached_level"][:, level]))
+    print(summarize(f"gift({GIFT_THRESHOLD})", result["gift_at"]))
+    print(summarize(f"goal({TOTAL_GOAL})", result["goal_at"]))
+
+
+def check_agreement(n_learners: int = 2000, n_problems: int = 200, seed: int = 1) -> bool:
+    """apply_results 와 apply_result 가 같은 결과를 내는지 검사"""
+    rng = np.random.default_rng(seed)
+
+    # 1. 임의 상태 한 단계 (최고 레벨에서 10개 초과로 쌓인 상태 포함)
+    level = rng.integers(1, MAX_LEVEL + 1, size=n_learners).astype(np.int8)
+    level_stickers = rng.integers(0, 15, size=n_learners).astype(np.int16)
+    total_stickers = rng.integers(0, 100, size=n_learners).astype(np.int32)
+    correct = rng.random(n_learners) < 0.5
+    vectorized = apply_results(level, level_stickers, total_stickers, correct)
+    for i in range(n_learners):
+        expected = apply_result(int(level[i]), int(level_stickers[i]), int(total_stickers[i]), bool(correct[i]))
+        actual = tuple(v[i].item() for v in vectorized)
+        if tuple(expected) != actual:
+            print(f"❌ Mismatch at state {i}: expected {tuple(expected)}, got {actual}")
+            return False
+
+    # 2. 처음부터 긴 문제 순서를 따라가며 비교
+    answers = rng.random((n_problems, n_learners)) < 0.8
+    level = np.ones(n_learners, dtype=np.int8)
+    level_stickers = np.zeros(n_learners, dtype=np.int16)
+    total_stickers = np.zeros(n_learners, dtype=np.int32)
+    scalar = [(1, 0, 0)] * n_learners
+    for step in range(n_problems):
+        level, level_stickers, total_stickers, _ = apply_results(level, level_stickers, total_stickers, answers[step])
+        scalar = [tuple(apply_result(*state, bool(answers[step, i]))[:3]) for i, state in enumerate(scalar)]
+        actual = list(zip(level.tolist(), level_stickers.tolist(), total_stickers.tolist()))
+        if actual != scalar:
+            print(f"❌ Mismatch after problem {step + 1}")
+            return False
+
+    print(f"✅ apply_results matches apply_result ({n_learners} states, {n_learners} learners x {n_problems} problems)")
+
+    # 3. 토큰 제출 경로: Increment 후 settle_level 로 정산한 결과가 apply_result 와 같은지
+    for level in range(1, MAX_LEVEL + 1):
+        for level_stickers in range(STICKERS_PER_LEVEL):
+            for is_correct in (False, True):
+                delta = int(is_correct)
+                expected = apply_result(level, level_stickers, 50, is_correct)
+                actual = settle_level(level, level_stickers + delta, 50 + delta)
+                if tuple(expected) != tuple(actual):
+                    print(f"❌ settle_level mismatch at Lv.{level}, {level_stickers} stickers, correct={is_correct}: "
+                          f"expected {tuple(expected)}, got {tuple(actual)}")
+                    return False
+
+    # 4. 레벨업 쓰기가 빠져 10개 이상 쌓인 상태도 다음 정산에서 레벨업
+    for level_stickers in range(STICKERS_PER_LEVEL, STICKERS_PER_LEVEL * 2):
+        settled = settle_level(1, level_stickers, level_stickers)
+        if not settled.levelup_event or settled.level_stickers != level_stickers - STICKERS_PER_LEVEL:
+            print(f"❌ settle_level does not heal {level_stickers} stickers: {tuple(settled)}")
+            return False
+
+    print("✅ settle_level matches apply_result for token submissions")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--learners", type=int, default=1_000_000)
+    parser.add_argument("--problems", type=int, default=300)
+    parser.add_argument("--accuracy", default=",".join(str(a) for a in DEFAULT_ACCURACY),
+                        help="레벨별 평균 정답률 (쉼표로 구분, 5개)")
+    parser.add_argument("--concentration", type=float, default=DEFAULT_CONCENTRATION,
+                        help="Beta 분포 집중도 (클수록 학습자 간 차이가 작음)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_agreement() else 1)
+
+    accuracy = [float(a) for a in args.accuracy.split(",")]
+    if len(accuracy) != MAX_LEVEL:
+        parser.error(f"--accuracy needs {MAX_LEVEL} values")
+
+    start = time.perf_counter()
+    result = simulate(args.learners, accuracy, args.concentration, args.problems, seed=args.seed)
+    print(f"🎲 {args.learners:,} learners x {args.problems} problems in {time.perf_counter() - start:.1f}s")
+    report(result)
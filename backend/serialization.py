@@ -0,0 +1,150 @@
+import os
+import gzip
+from typing import Any, Optional
+import brotli
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+# 이 크기보다 작은 응답은 압축해도 이득이 거의 없습니다.
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# 텍스트 계열만 압축 (audio/*, image/* 등 이미 압축된 바이너리는 건너뜀)
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "image/svg+xml",
+    "text/",
+)
+
+
+def sse_event(event: str, data: Any) -> bytes:
+    """Server-Sent Events 한 건 (orjson 출력은 한 줄이라 data 줄 하나로 충분)"""
+    return b"event: " + event.encode("utf-8") + b"\ndata: " + orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Accept-Encoding 헤더에서 사용할 압축 방식 선택 (br > gzip)"""
+    if not accept_encoding:
+        return None
+
+    accepted = set()
+    for token in accept_encoding.split(","):
+        name, _, params = token.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(name.strip().lower())
+
+    if "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    if not content_type:
+        return False
+    content_type = content_type.split(";")[0].strip().lower()
+    # SSE 는 이벤트 단위로 바로 흘려보내야 하므로 압축하지 않음
+    if content_type == "text/event-stream":
+        return False
+    return any(content_type.startswith(t) for t in COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """크기 기준 선택적 gzip/brotli 압축 (ASGI 미들웨어)
+
+    - 이미 Content-Encoding 이 있는 응답(미리 압축된 응답)은 그대로 통과
+    - 스트리밍 응답(more_body)은 버퍼링하지 않고 그대로 통과
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        body_parts = []
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or not is_compressible(headers.get("content-type")):
+                    passthrough = True
+                    await send(message)
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body_parts.append(message.get("body", b""))
+            if message.get("more_body", False):
+                # 스트리밍 응답: 지금까지 받은 내용을 흘려보내고 이후는 통과
+                passthrough = True
+                await send(start_message)
+                await send({"type": "http.response.body", "body": b"".join(body_parts), "more_body": True})
+                return
+
+            body = b"".join(body_parts)
+            if len(body) >= self.minimum_size:
+                body = compress(body, encoding)
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                start_message["headers"] = headers.raw
+
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class PrecomputedJSON:
+    """정적인 응답을 한 번만 직렬화/압축해 두고 재사용"""
+
+    def __init__(self, content: Any, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.body = orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        self.minimum_size = minimum_size
+        self._encoded = {}
+
+    def response(self, accept_encoding: Optional[str] = None) -> Response:
+        encoding = negotiate_encoding(accept_encoding) if len(self.body) >= self.minimum_size else None
+        if not encoding:
+            return Response(content=self.body, media_type="application/json")
+
+        if encoding not in self._encoded:
+            self._encoded[encoding] = compress(self.body, encoding)
+        return Response(
+            content=self._encoded[encoding],
+            media_type="application/json",
+            headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+        )
@@ -10,6 +10,7 @@ import GiftPopup from '../components/GiftPopup';
 import IntroScreen from '../components/IntroScreen';
 import GameHeader from '../components/GameHeader';
 import { Problem, Stats, Explanation, INITIAL_PROBLEM, API_URL, GIFT_THRESHOLD, TOTAL_GOAL } from '../lib/types';
+import { fetchWithRetry } from '../lib/utils/fetchWithRetry';
 import { useAudio } from '../lib/hooks/useAudio';
 import { useTimer } from '../lib/hooks/useTimer';
 import { useSpeechRecognition } from '../lib/hooks/useSpeechRecognition';
@@ -308,13 +309,14 @@ export default function Home() {
             setFeedback("정답입니다! 🎉");
 
             try {
-                const res = await fetch(`${API_URL}/submit-result`, {
+                const res = await fetchWithRetry(`${API_URL}/submit-result`, {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({
                         user_id: user,
                         session_id: sessionId,
                         problem_id: problem.id,
+                        problem_token: problem.token,
                         problem: problem.problem,
                         answer: problem.answer,
                         user_answer: answerOverride || userAnswer,
@@ -368,33 +370,27 @@ export default function Home() {
             setTimeout(() => setShake(false), 500);
             setLoading(true);
             try {
-                await fetch(`${API_URL}/submit-result`, {
+                // Submit the result and get the explanation in a single round trip
+                const res = await fetchWithRetry(`${API_URL}/submit-answer`, {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({
                         user_id: user,
                         session_id: sessionId,
                         problem_id: problem.id,
+                        problem_token: problem.token,
                         problem: problem.problem,
                         answer: problem.answer,
                         user_answer: isTimeout ? "TIMEOUT" : (answerOverride || userAnswer),
                         is_correct: false,
-                        source: problem.source || 'unknown'
-                    }),
-                    cache: 'no-store'
-                });
-
-                const res = await fetch(`${API_URL}/explain-error`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        problem: currentProblem.problem,
-                        wrong_answer: isTimeout ? "시간초과" : (answerOverride || userAnswer),
+                        source: problem.source || 'unknown',
                         user_name: userName
                     }),
                     cache: 'no-store'
                 });
-                const data = await res.json();
+                const result = await res.json();
+                const data = result.explanation;
+                if (!data) throw new Error("No explanation in response");
                 setExplanation({ ...data, problem: currentProblem.problem });
                 if (data.audio_base64) {
                     playAudio(data.audio_base64);
@@ -632,9 +628,9 @@ export default function Home() {
                                     {/* Visual Area */}
                                     <div className="w-full md:w-3/5 bg-slate-50 p-4 md:p-8 flex items-center justify-center min-h-[300px]">
                                         <VisualExplanation
-                                            count1={parseInt((explanation.problem || "0+0").split(/[\+\-]/)[0])}
-                                            count2={parseInt((explanation.problem || "0+0").split(/[\+\-]/)[1])}
-                                            operator={(explanation.problem || "0+0").includes('+') ? '+' : '-'}
+                                            count1={explanation.visual_operands?.count1 ?? parseInt((explanation.problem || "0+0").split(/[\+\-]/)[0])}
+                                            count2={explanation.visual_operands?.count2 ?? parseInt((explanation.problem || "0+0").split(/[\+\-]/)[1])}
+                                            operator={explanation.visual_operands?.operator ?? ((explanation.problem || "0+0").includes('+') ? '+' : '-')}
                                             visualItems={explanation.visual_items}
                                             isDetective={explanation.is_detective}
                                         />
@@ -5,6 +5,7 @@ export interface Problem {
     answer: number;
     level: number;
     source?: 'gemini' | 'fallback';
+    token?: string;
 }
 
 export interface Stats {
@@ -28,6 +29,12 @@ export interface Explanation {
     audio_base64?: string;
     problem?: string;
     is_detective?: boolean;
+    // Server-computed operands (blank filled, multi-operator forms reduced to two terms)
+    visual_operands?: {
+        count1: number;
+        count2: number;
+        operator: '+' | '-';
+    };
 }
 
 export const INITIAL_PROBLEM: Problem = {
@@ -0,0 +1,18 @@
+// Retry helper for idempotent endpoints (e.g. /submit-result is deduplicated by problem_id)
+export const fetchWithRetry = async (
+    url: string,
+    init: RequestInit,
+    retries = 3,
+    backoffMs = 300
+): Promise<Response> => {
+    for (let attempt = 0; ; attempt++) {
+        try {
+            const res = await fetch(url, init);
+            // Retry only on server errors; client errors won't succeed on retry
+            if (res.status < 500 || attempt >= retries) return res;
+        } catch (error) {
+            if (attempt >= retries) throw error;
+        }
+        await new Promise(resolve => setTimeout(resolve, backoffMs * 2 ** attempt));
+    }
+};